@@ -0,0 +1,258 @@
+"""
+Offline benchmarks of the scan, the listing extraction and the database writes.
+
+Run from the repository root:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --fetch-mode browser --pages 10
+The browser path launches a headed chromium, use xvfb-run on a machine
+without a display.
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from benchmarks.server import FIXTURES_DIR, FixtureServer
+from common.constants import USER_AGENT
+from common.listing import ListingRecord
+from database.database_manager import DatabaseManager
+from services.browser_service import BrowserManager
+from services.config_service import ConfigEntry, RoutingTable
+from services.extract_service import (
+    extract_html_record,
+    parse_html,
+    parse_result,
+    RESULTS_SELECTOR,
+)
+from services.metrics_service import Histogram, PAGE_LOAD_SECONDS, PAGE_PARSE_SECONDS
+from spider.spider import run_spider
+
+
+def report(name: str, value: float, unit: str):
+    """
+    Prints a single benchmark result.
+    """
+    print(f"{name:<40} {value:>12.3f} {unit}")
+
+
+def histogram_mean(histogram: Histogram, before: tuple[float, int]) -> float:
+    """
+    Returns the mean of the values observed since the (sum, count) snapshot.
+    """
+    total, count = histogram_snapshot(histogram)
+    count -= before[1]
+    return (total - before[0]) / count if count else 0.0
+
+
+def histogram_snapshot(histogram: Histogram) -> tuple[float, int]:
+    """
+    Returns the current sum and count of the histogram.
+    """
+    return histogram.sum, sum(histogram.counts)
+
+
+def benchmark_extraction(repeat: int):
+    """
+    Measures parsing of the fixture pages and of a single listing.
+    """
+    pages = [
+        path.read_text(encoding="utf-8")
+        for path in sorted(FIXTURES_DIR.glob("results_page_*.html"))
+    ]
+
+    page_times = []
+    listings = 0
+    for _ in range(repeat):
+        for html in pages:
+            start_time = time.perf_counter()
+            results, _ = parse_html(html)
+            page_times.append(time.perf_counter() - start_time)
+            listings += len(results)
+
+    records = [
+        extract_html_record(item)
+        for html in pages
+        for item in BeautifulSoup(html, "html.parser").select(RESULTS_SELECTOR)
+    ]
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            parse_result(record)
+    result_time = (time.perf_counter() - start_time) / (repeat * len(records))
+
+    report("parse_html per page", statistics.median(page_times) * 1000, "ms")
+    report("parse_html per listing", sum(page_times) / max(listings, 1) * 1000000, "µs")
+    report("parse_result per listing", result_time * 1000000, "µs")
+
+
+async def benchmark_database(listings: int):
+    """
+    Measures saving a scan of new listings and of changed prices.
+    """
+    data = {
+        f"listing_{index}": ListingRecord(
+            title=f"Listing {index}",
+            image_url=None,
+            description="Description",
+            price=float(500 + index % 1000),
+            size=float(30 + index % 100),
+            year=1990,
+            floor="2/4",
+            url=f"https://www.nepremicnine.net/oglasi-oddaja/listing_{index}/",
+        )
+        for index in range(listings)
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_manager = DatabaseManager(
+            url=f"sqlite+aiosqlite:///{Path(directory) / 'benchmark.sqlite'}"
+        )
+        await database_manager.migrate()
+
+        start_time = time.perf_counter()
+        await database_manager.save_scan(new_listings=data, new_prices={})
+        insert_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        last_prices = await database_manager.get_last_prices(data.keys())
+        lookup_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        await database_manager.save_scan(
+            new_listings={},
+            new_prices={
+                listing_id: price + 10 for listing_id, price, _ in last_prices.values()
+            },
+        )
+        price_time = time.perf_counter() - start_time
+
+        await database_manager.cleanup()
+
+    report(f"save {listings} new listings", insert_time * 1000, "ms")
+    report("save new listing per row", insert_time / listings * 1000000, "µs")
+    report(f"look up {listings} last prices", lookup_time * 1000, "ms")
+    report("save changed price per row", price_time / listings * 1000000, "µs")
+
+
+async def benchmark_scan(  # pylint: disable=too-many-locals
+    pages: int, repeat: int, fetch_mode: str, concurrency: int, page_window: int
+):
+    """
+    Measures full scans of the stand-in search.
+    Every scan starts with an empty database, so all listings are saved.
+    """
+    browser_manager = BrowserManager(cache_dir=None)
+
+    async with FixtureServer(page_count=pages) as server:
+        routing_table = RoutingTable([ConfigEntry(channel_id="1", url=server.url)])
+
+        scan_times = []
+        listings = 0
+        load_before = histogram_snapshot(PAGE_LOAD_SECONDS)
+        parse_before = histogram_snapshot(PAGE_PARSE_SECONDS)
+
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as directory:
+                database_manager = DatabaseManager(
+                    url=f"sqlite+aiosqlite:///{Path(directory) / 'benchmark.sqlite'}"
+                )
+                await database_manager.migrate()
+
+                start_time = time.perf_counter()
+                discord_listings, error, _ = await run_spider(
+                    database_manager=database_manager,
+                    browser_manager=browser_manager,
+                    concurrency=concurrency,
+                    host_delay=0,
+                    page_window=page_window,
+                    fetch_mode=fetch_mode,
+                    incremental=False,
+                    routing_table=routing_table,
+                )
+                scan_times.append(time.perf_counter() - start_time)
+
+                await database_manager.cleanup()
+
+            if error:
+                raise RuntimeError("Scan of the stand-in search failed.")
+            listings += len(discord_listings["1"])
+
+        await browser_manager.close()
+
+    total_time = sum(scan_times)
+    report(f"{fetch_mode} scan of {pages} pages", statistics.median(scan_times), "s")
+    report(f"{fetch_mode} scan pages", pages * repeat / total_time, "pages/s")
+    report(f"{fetch_mode} scan listings", listings / total_time, "listings/s")
+    report(
+        f"{fetch_mode} page load",
+        histogram_mean(PAGE_LOAD_SECONDS, load_before) * 1000,
+        "ms",
+    )
+    report(
+        f"{fetch_mode} page parse",
+        histogram_mean(PAGE_PARSE_SECONDS, parse_before) * 1000,
+        "ms",
+    )
+
+
+async def record_fixtures(url: str, pages: int):
+    """
+    Saves live result pages of the search as the fixtures.
+    """
+    async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as session:
+        for page in range(1, pages + 1):
+            page_url = url if page == 1 else f"{url}{page}/"
+            async with session.get(page_url) as response:
+                response.raise_for_status()
+                html = await response.text()
+            path = FIXTURES_DIR / f"results_page_{page}.html"
+            path.write_text(html, encoding="utf-8")
+            print(f"Saved {page_url} to {path}.")
+
+
+async def main():
+    """
+    Runs the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=20, help="result pages per scan")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions")
+    parser.add_argument("--listings", type=int, default=2000, help="saved listings")
+    parser.add_argument("--fetch-mode", choices=("http", "browser"), default="http")
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--page-window", type=int, default=1)
+    parser.add_argument(
+        "--record", metavar="URL", help="save live result pages of the search url"
+    )
+    parser.add_argument(
+        "--record-pages", type=int, default=3, help="number of recorded pages"
+    )
+    args = parser.parse_args()
+
+    if args.record:
+        await record_fixtures(url=args.record, pages=args.record_pages)
+        return
+
+    # Only the benchmark results are printed.
+    logging.disable(logging.INFO)
+
+    benchmark_extraction(repeat=args.repeat)
+    await benchmark_database(listings=args.listings)
+    await benchmark_scan(
+        pages=args.pages,
+        repeat=args.repeat,
+        fetch_mode=args.fetch_mode,
+        concurrency=args.concurrency,
+        page_window=args.page_window,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
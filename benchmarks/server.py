@@ -0,0 +1,83 @@
+"""Local stand-in of the nepremicnine.net search result pages."""
+
+import re
+from pathlib import Path
+
+from aiohttp import web
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Path of the served search.
+SEARCH_PATH = "/oglasi-oddaja/ljubljana-mesto/stanovanje/"
+
+# Listing ids of the fixtures, shifted on every cycle through the fixtures.
+LISTING_ID_PATTERN = re.compile(r"69\d{5}")
+
+# Next page button of the fixtures.
+NEXT_PAGE_PATTERN = re.compile(r'<li class="paging_next">.*?</li>')
+
+
+class FixtureServer:
+    """
+    Serves the saved result pages of a single search with pagination.
+    Fixtures are served in a cycle, with listing ids made unique for every
+    page, so any number of pages can be served. The last page has no next
+    page button.
+    """
+
+    def __init__(self, page_count: int, host: str = "127.0.0.1", port: int = 8765):
+        self.page_count = page_count
+        self.host = host
+        self.port = port
+        self.fixtures = [
+            path.read_text(encoding="utf-8")
+            for path in sorted(FIXTURES_DIR.glob("results_page_*.html"))
+        ]
+        self.runner: web.AppRunner | None = None
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        """
+        Returns the url of the first result page.
+        """
+        return f"http://{self.host}:{self.port}{SEARCH_PATH}"
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get(SEARCH_PATH, self.handle_page)
+        app.router.add_get(SEARCH_PATH + "{page:\\d+}/", self.handle_page)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.runner.cleanup()
+
+    def render_page(self, page: int) -> str:
+        """
+        Returns the html of the result page.
+        :param page: page number starting with 1
+        :return: str
+        """
+        cycle, index = divmod(page - 1, len(self.fixtures))
+        html = LISTING_ID_PATTERN.sub(
+            lambda match: str(int(match.group()) + cycle * 10000), self.fixtures[index]
+        )
+        if page >= self.page_count:
+            html = NEXT_PAGE_PATTERN.sub("", html)
+        elif "paging_next" not in html:
+            html = html.replace(
+                '<ul class="pagination">',
+                '<ul class="pagination"><li class="paging_next"><a href="#">&raquo;</a></li>',
+            )
+        return html
+
+    async def handle_page(self, request: web.Request) -> web.Response:
+        """
+        Returns a result page. Pages after the last page repeat the last page.
+        """
+        self.requests += 1
+        page = min(int(request.match_info.get("page", 1)), self.page_count)
+        return web.Response(text=self.render_page(page), content_type="text/html")
@@ -2,3 +2,181 @@
 
 # Resource types that will be blocked.
 excluded_resource_types = ["image", "font", "media"]
+
+# Third-party domains (and their subdomains) that will be blocked.
+blocked_domains = [
+    "adform.net",
+    "criteo.com",
+    "doubleclick.net",
+    "facebook.com",
+    "facebook.net",
+    "gemius.pl",
+    "google-analytics.com",
+    "googlesyndication.com",
+    "googletagmanager.com",
+    "googletagservices.com",
+    "hotjar.com",
+]
+
+# Resource types that will be served from the disk cache.
+cached_resource_types = ["stylesheet", "script"]
+
+# User agent used by the browser pages.
+# pylint: disable=line-too-long
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
+
+# Pragmas set on every SQLite connection.
+SQLITE_PRAGMAS = {
+    # Readers do not block the writer.
+    "journal_mode": "WAL",
+    # Safe with WAL and avoids an fsync on every commit.
+    "synchronous": "NORMAL",
+    # Negative value is the page cache size in KiB.
+    "cache_size": -16000,
+    "mmap_size": 128 * 1024 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+# Default number of pooled database connections.
+DEFAULT_DB_POOL_SIZE = 5
+
+# Default number of database connections allowed above the pool size.
+DEFAULT_DB_MAX_OVERFLOW = 5
+
+# Default number of result pages that can be loaded at the same time.
+DEFAULT_SPIDER_CONCURRENCY = 3
+
+# Default number of consecutive result pages of a single search loaded in parallel.
+DEFAULT_SPIDER_PAGE_WINDOW = 1
+
+# Default minimum delay in seconds between two requests to the same host.
+DEFAULT_SPIDER_HOST_DELAY = 1.0
+
+# Stop paginating a search when a result page contains only known listings,
+# for searches without the incremental config option.
+DEFAULT_SPIDER_INCREMENTAL = False
+
+# Default number of scans after which all pages of every search are crawled again.
+DEFAULT_SPIDER_FULL_SWEEP_EVERY = 24
+
+# Default way of fetching result pages ("http" with browser fallback or "browser").
+DEFAULT_SPIDER_FETCH_MODE = "http"
+
+# Number of failed HTTP fetches after which only the browser is used in a scan.
+HTTP_MAX_FAILURES = 3
+
+# Timeout in seconds of a single HTTP request.
+HTTP_TIMEOUT = 30
+
+# Default number of scans after which the browser is restarted.
+DEFAULT_BROWSER_MAX_SCANS = 24
+
+# Default directory of the static assets cache.
+DEFAULT_BROWSER_CACHE_DIR = ".cache/assets"
+
+# Default memory usage in MB of the browser processes after which the browser is restarted.
+DEFAULT_BROWSER_MAX_MEMORY_MB = 1024
+
+# Time in milliseconds to wait for the cookie consent dialog.
+COOKIE_DIALOG_TIMEOUT = 10000
+
+# Maximum number of embeds in a single discord message.
+DELIVERY_MAX_EMBEDS = 10
+
+# Maximum number of characters of all embeds in a single discord message.
+DELIVERY_MAX_EMBED_CHARACTERS = 6000
+
+# Number of times a failed discord message is retried.
+DELIVERY_MAX_RETRIES = 5
+
+# Delay in seconds before the first retry, doubled for every next retry.
+DELIVERY_RETRY_DELAY = 2.0
+
+# Seconds between two checks of the notification outbox.
+OUTBOX_POLL_INTERVAL = 60
+
+# Maximum number of notifications read from the outbox at once.
+OUTBOX_BATCH_SIZE = 500
+
+# Number of failed deliveries after which a notification is not retried anymore.
+OUTBOX_MAX_ATTEMPTS = 10
+
+# Days after which delivered notifications are deleted from the outbox.
+OUTBOX_RETENTION_DAYS = 7
+
+# Seconds between two checks for searches that are due.
+SCHEDULER_TICK = 60
+
+# Default minimum minutes between two scans of a search.
+DEFAULT_SCHEDULER_MIN_INTERVAL = 15
+
+# Default maximum minutes between two scans of a search.
+DEFAULT_SCHEDULER_MAX_INTERVAL = 360
+
+# Default fraction by which a scan interval is randomly shortened or extended.
+DEFAULT_SCHEDULER_JITTER = 0.1
+
+# Minutes between the scans of a search before its listing rate is known.
+SCHEDULER_INITIAL_INTERVAL = 60
+
+# Number of new listings a scan of a search should find on average.
+SCHEDULER_TARGET_LISTINGS = 1.0
+
+# Weight of the latest scan in the moving average of the new listing rate.
+SCHEDULER_RATE_SMOOTHING = 0.3
+
+# Path of the config file with the channels and their searches.
+CONFIG_PATH = "config.txt"
+
+# Upper bounds in seconds of the latency histogram buckets.
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Default address of the metrics endpoint.
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+# Default level of the application logs.
+DEFAULT_LOG_LEVEL = "INFO"
+
+# Default format of the application logs: "text" (colored) or "json" (one object per line).
+DEFAULT_LOG_FORMAT = "text"
+
+# Seconds a slash command answer is cached, the cache is also cleared after every scan.
+QUERY_CACHE_TTL = 600
+
+# Maximum number of cached slash command answers.
+QUERY_CACHE_MAX_ENTRIES = 256
+
+# Number of listings on a page of the /search answer.
+QUERY_PAGE_SIZE = 10
+
+# Number of latest prices in the /price-history answer.
+QUERY_HISTORY_SIZE = 25
+
+# Minimum number of listings with a size in a region to compute its market baseline.
+ANALYTICS_MIN_BASELINE_LISTINGS = 10
+
+# Default number of listing pages loaded at the same time by the enrichment.
+DEFAULT_ENRICHMENT_CONCURRENCY = 2
+
+# Default maximum number of listing pages loaded by the enrichment after a scan.
+DEFAULT_ENRICHMENT_BUDGET = 20
+
+# Number of MinHash values in the text signature of a listing.
+# Changing it makes the saved signatures incomparable.
+DEDUP_NUM_PERM = 64
+
+# Number of LSH bands of a signature, listings sharing a band are compared.
+DEDUP_BANDS = 16
+
+# Number of characters in a text shingle of a listing.
+DEDUP_SHINGLE_SIZE = 5
+
+# Minimum estimated similarity of the title and description of a repost.
+DEDUP_MIN_SIMILARITY = 0.7
+
+# Maximum relative difference of the size of a repost.
+DEDUP_SIZE_TOLERANCE = 0.03
+
+# Maximum relative difference of the price of a repost.
+DEDUP_PRICE_TOLERANCE = 0.3
@@ -0,0 +1,132 @@
+"""Module that contains the listing record shared by the crawler, the database and discord."""
+
+import hashlib
+from array import array
+
+# Listing fields compared by the content hash, the price is tracked separately.
+CONTENT_FIELDS = ("title", "image_url", "description", "size", "year", "floor")
+
+
+class ListingRecord:  # pylint: disable=too-many-instance-attributes
+    """
+    Data of a single listing found on a result page.
+    The region is the region of the search the listing was found with.
+    The price history is attached once the previous prices are known, as
+    a compact array of floats from the oldest to the newest price.
+    """
+
+    __slots__ = (
+        "title",
+        "image_url",
+        "description",
+        "price",
+        "size",
+        "year",
+        "floor",
+        "url",
+        "prices",
+        "region",
+        "analytics",
+    )
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        title: str,
+        image_url: str | None,
+        description: str,
+        price: float,
+        size: float,
+        year: int | None,
+        floor: str | None,
+        url: str,
+        prices: array | None = None,
+        region: str | None = None,
+        analytics: dict | None = None,
+    ):
+        self.title = title
+        self.image_url = image_url
+        self.description = description
+        self.price = price
+        self.size = size
+        self.year = year
+        self.floor = floor
+        self.url = url
+        self.prices = prices
+        self.region = region
+        # Price analytics, see services.analytics_service.
+        self.analytics = analytics
+
+    def __repr__(self) -> str:
+        return f"ListingRecord({self.url!r}, price={self.price!r})"
+
+    def attach_prices(self, history: array | None = None):
+        """
+        Attaches the price history ending with the current price.
+        The history array is extended in place, not copied.
+        Does nothing if the history is already attached.
+        :param history: previous prices, None for a new listing
+        :return:
+        """
+        if self.prices is not None:
+            return
+
+        self.prices = history if history is not None else array("d")
+        self.prices.append(self.price)
+
+    def content(self) -> dict:
+        """
+        Returns the content fields of the listing.
+        :return: dict
+        """
+        return {name: getattr(self, name) for name in CONTENT_FIELDS}
+
+    def content_hash(self) -> str:
+        """
+        Returns a hash of the content fields, so a changed listing is found
+        by comparing a single value.
+        :return: str
+        """
+        content = "\x1f".join(repr(getattr(self, name)) for name in CONTENT_FIELDS)
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    def to_payload(self) -> dict:
+        """
+        Returns the listing as a JSON serializable dict.
+        :return: dict
+        """
+        payload = {name: getattr(self, name) for name in self.__slots__}
+        if self.prices is not None:
+            payload["prices"] = self.prices.tolist()
+        return payload
+
+    @classmethod
+    def from_payload(cls, payload: dict | list) -> "ListingRecord":
+        """
+        Builds the listing from a saved payload.
+        Payloads saved before the record existed are lists of the listing
+        fields with the price history in place of the price.
+        :param payload: dict | list
+        :return: ListingRecord
+        """
+        if isinstance(payload, list):
+            title, image_url, description, prices, size, year, floor, url = payload
+            payload = {
+                "title": title,
+                "image_url": image_url,
+                "description": description,
+                "price": prices[-1],
+                "size": size,
+                "year": year,
+                "floor": floor,
+                "url": url,
+                "prices": prices,
+            }
+
+        prices = payload.get("prices")
+        return cls(
+            **{
+                **payload,
+                "prices": array("d", prices) if prices is not None else None,
+            }
+        )
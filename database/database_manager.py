@@ -2,11 +2,25 @@
 Database manager module.
 """
 
-import threading
+import json
+import time
 from asyncio import current_task
-from datetime import datetime
+from datetime import datetime, timedelta
+from array import array
+from typing import Iterable
 
-from sqlalchemy import exc, select, Result, func
+from sqlalchemy import (
+    delete,
+    event,
+    func,
+    insert,
+    select,
+    tuple_,
+    union_all,
+    update,
+    Result,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
@@ -15,28 +29,64 @@ from sqlalchemy.ext.asyncio import (
     async_scoped_session,
 )
 
-from database.models import meta, Listing, Price
+from common.constants import (
+    DEFAULT_DB_MAX_OVERFLOW,
+    DEFAULT_DB_POOL_SIZE,
+    SQLITE_PRAGMAS,
+)
+from common.listing import CONTENT_FIELDS, ListingRecord
+from database.migrations import migrate
+from database.models import (
+    Listing,
+    ListingBand,
+    ListingChange,
+    ListingDetail,
+    Outbox,
+    Price,
+)
 from logger.logger import logger
+from services.metrics_service import DB_COMMIT_SECONDS, DB_QUERY_SECONDS
 
+# Maximum number of rows in a single multi-row insert.
+INSERT_CHUNK_SIZE = 500
 
-class DatabaseManager:
+
+class DatabaseManager:  # pylint: disable=too-many-public-methods
     """
     Class for interacting with the database.
+    One instance is shared by the whole application. The engine is created
+    on first use with tuned SQLite pragmas and a sized connection pool.
     """
 
-    def __init__(self, url: str):
-        self.db_connections = threading.local()
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = DEFAULT_DB_POOL_SIZE,
+        max_overflow: int = DEFAULT_DB_MAX_OVERFLOW,
+    ):
         self.url = url
+        self.engine_options = {"pool_size": pool_size, "max_overflow": max_overflow}
+        self.engine: AsyncEngine | None = None
+        self.session_factory: async_sessionmaker | None = None
+        self.scoped_session: async_scoped_session[AsyncSession] | None = None
+        self.query_stats = {"count": 0, "time": 0.0, "max_time": 0.0}
 
     def async_engine(self) -> AsyncEngine:
         """
         Returns the async engine.
         """
-        if not hasattr(self.db_connections, "engine"):
+        if self.engine is None:
             logger.debug("Getting async engine.")
-            self.db_connections.engine = create_async_engine(self.url)
+            self.engine = create_async_engine(self.url, **self.engine_options)
+            event.listen(self.engine.sync_engine, "connect", set_sqlite_pragmas)
+            event.listen(
+                self.engine.sync_engine, "before_cursor_execute", start_query_timer
+            )
+            event.listen(
+                self.engine.sync_engine, "after_cursor_execute", self.record_query
+            )
             logger.debug("Creating database engine finished.")
-        return self.db_connections.engine
+        return self.engine
 
     def async_session_factory(self) -> async_sessionmaker:
         """
@@ -44,10 +94,10 @@ class DatabaseManager:
         :return:
         """
         logger.debug("Getting async session factory.")
-        if not hasattr(self.db_connections, "session_factory"):
+        if self.session_factory is None:
             engine = self.async_engine()
-            self.db_connections.session_factory = async_sessionmaker(bind=engine)
-        return self.db_connections.session_factory
+            self.session_factory = async_sessionmaker(bind=engine)
+        return self.session_factory
 
     def async_scoped_session(self) -> async_scoped_session[AsyncSession]:
         """
@@ -55,12 +105,12 @@ class DatabaseManager:
         :return:
         """
         logger.debug("Getting async scoped session.")
-        if not hasattr(self.db_connections, "scoped_session"):
+        if self.scoped_session is None:
             session_factory = self.async_session_factory()
-            self.db_connections.scoped_session = async_scoped_session(
+            self.scoped_session = async_scoped_session(
                 session_factory, scopefunc=current_task
             )
-        return self.db_connections.scoped_session
+        return self.scoped_session
 
     async def cleanup(self):
         """
@@ -69,110 +119,707 @@ class DatabaseManager:
         """
         logger.debug("Cleaning database engine.")
 
-        await self.db_connections.engine.dispose()
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+            self.session_factory = None
+            self.scoped_session = None
         logger.debug("Cleaning database finished.")
 
-    async def create_models(self):
+    def record_query(
+        self, conn, _cursor, _statement, _parameters, _context, _executemany
+    ):  # pylint: disable=too-many-arguments
         """
-        Creates all required database tables from the declared models.
+        Records the duration of an executed query.
         """
-        logger.debug("Creating ORM modules.")
-        async with self.async_engine().begin() as conn:
-            await conn.run_sync(meta.create_all)
-        logger.debug("Finished creating ORM modules.")
+        start_times = conn.info.get("query_start_time")
+        if not start_times:
+            return
+        elapsed = time.perf_counter() - start_times.pop()
+        self.query_stats["count"] += 1
+        self.query_stats["time"] += elapsed
+        self.query_stats["max_time"] = max(self.query_stats["max_time"], elapsed)
+        DB_QUERY_SECONDS.observe(elapsed)
 
-    async def add_new_price(
+    def stats(self) -> dict:
+        """
+        Returns connection pool and query statistics.
+        :return: dict
+        """
+        count = self.query_stats["count"]
+        stats = {
+            "queries": count,
+            "query_time": self.query_stats["time"],
+            "avg_query_time": self.query_stats["time"] / count if count else 0.0,
+            "max_query_time": self.query_stats["max_time"],
+        }
+        if self.engine is not None:
+            pool = self.engine.pool
+            stats["pool"] = pool.status()
+            stats["checked_out"] = getattr(pool, "checkedout", lambda: None)()
+        return stats
+
+    async def migrate(self) -> int:
+        """
+        Creates or upgrades the database schema in place.
+        :return: the schema version
+        """
+        logger.debug("Migrating database schema.")
+        version = await migrate(self.async_engine())
+        logger.debug("Finished migrating database schema.")
+        return version
+
+    async def save_scan(  # pylint: disable=too-many-arguments,too-many-locals
         self,
-        listing_id: int,
-        current_price: float,
-    ):
+        new_listings: dict[str, ListingRecord],
+        new_prices: dict[int, float],
+        *,
+        notifications: list[tuple[str, str, dict]] | None = None,
+        changed_listings: dict[int, ListingRecord] | None = None,
+        listing_changes: list[tuple[int, str, str | None, str | None]] | None = None,
+        signatures: dict[str, tuple[bytes, list[tuple[int, int]]]] | None = None,
+        reposts: dict[str, int] | None = None,
+        regions: dict[str, list[str]] | None = None,
+    ) -> list[str]:
         """
-        Adds a new price to the listing.
+        Saves all new listings, price changes, content changes and
+        notifications of a scan in one transaction using multi-row inserts.
+        Listings that conflict with existing rows are skipped, the rest of the
+        batch is still saved. Notifications with an already saved dedup key
+        are skipped.
+        :param new_listings: new listings data by nepremicnine id
+        :param new_prices: new prices by listing id
+        :param notifications: list of (channel id, dedup key, payload)
+        :param changed_listings: listings with changed content by listing id
+        :param listing_changes: list of (listing id, field, old value, new value)
+        :param signatures: (signature, LSH band keys) of new listings by nepremicnine id
+        :param reposts: listing id of the original listing by nepremicnine id of a repost
+        :param regions: nepremicnine ids of the crawled listings by region, saved
+            listings without a region get the region they were crawled with
+        :return: nepremicnine ids of the conflicting listings
         """
-        logger.debug("Saving new price in the database.")
+        logger.debug(
+            "Saving %d new listings and %d new prices to the database.",
+            len(new_listings),
+            len(new_prices),
+        )
+
+        if not (
+            new_listings
+            or new_prices
+            or notifications
+            or changed_listings
+            or listing_changes
+            or regions
+        ):
+            return []
+
+        accessed_time = datetime.now()
+
         async with self.async_session_factory()() as session:
+            start_time = time.perf_counter()
 
-            listing = await session.get(Listing, listing_id)
+            async with session.begin():
+                listing_ids = {}
+                signatures = signatures or {}
+                reposts = reposts or {}
 
-            price = Price(accessed_time=datetime.now(), price=current_price)
-            session.add(price)
-            listing.prices.append(price)
+                listing_rows = [
+                    {
+                        "url": data.url,
+                        "accessed_time": accessed_time,
+                        "nepremicnine_id": item_id,
+                        "last_price": data.price,
+                        "region": data.region,
+                        "content_hash": data.content_hash(),
+                        "minhash": (
+                            signatures[item_id][0] if item_id in signatures else None
+                        ),
+                        "duplicate_of": reposts.get(item_id),
+                        **data.content(),
+                    }
+                    for item_id, data in new_listings.items()
+                ]
+                for chunk in chunks(listing_rows):
+                    result: Result = await session.execute(
+                        sqlite_insert(Listing)
+                        .values(chunk)
+                        .on_conflict_do_nothing()
+                        .returning(Listing.id, Listing.nepremicnine_id)
+                    )
+                    listing_ids.update(
+                        (nepremicnine_id, listing_id)
+                        for listing_id, nepremicnine_id in result.all()
+                    )
 
-            await session.flush()
-            await session.commit()
+                price_rows = [
+                    {
+                        "listing_id": listing_ids[item_id],
+                        "accessed_time": accessed_time,
+                        "price": data.price,
+                    }
+                    for item_id, data in new_listings.items()
+                    if item_id in listing_ids
+                ] + [
+                    {
+                        "listing_id": listing_id,
+                        "accessed_time": accessed_time,
+                        "price": price,
+                    }
+                    for listing_id, price in new_prices.items()
+                ]
+                for chunk in chunks(price_rows):
+                    await session.execute(insert(Price).values(chunk))
 
-            logger.debug("Price saved.")
+                band_rows = [
+                    {"band": band, "bucket": bucket, "listing_id": listing_ids[item_id]}
+                    for item_id, (_, band_keys) in signatures.items()
+                    if item_id in listing_ids
+                    for band, bucket in band_keys
+                ]
+                for chunk in chunks(band_rows):
+                    await session.execute(
+                        sqlite_insert(ListingBand)
+                        .values(chunk)
+                        .on_conflict_do_nothing()
+                    )
 
-    async def save_listing(
-        self,
-        item_id: str,
-        data: tuple[str, str | None, str, float, float, int, str | None, str | None],
-    ):
+                # Keep the denormalized last price up to date.
+                if new_prices:
+                    await session.execute(
+                        update(Listing),
+                        [
+                            {"id": listing_id, "last_price": price}
+                            for listing_id, price in new_prices.items()
+                        ],
+                    )
+
+                for region, item_ids in (regions or {}).items():
+                    for chunk in chunks(item_ids):
+                        await session.execute(
+                            update(Listing)
+                            .where(
+                                Listing.nepremicnine_id.in_(chunk),
+                                Listing.region.is_(None),
+                            )
+                            .values(region=region)
+                        )
+
+                # Content changes are found by the hash, only the changed
+                # listings are updated.
+                if changed_listings:
+                    await session.execute(
+                        update(Listing),
+                        [
+                            {
+                                "id": listing_id,
+                                "content_hash": data.content_hash(),
+                                **data.content(),
+                            }
+                            for listing_id, data in changed_listings.items()
+                        ],
+                    )
+
+                change_rows = [
+                    {
+                        "listing_id": listing_id,
+                        "accessed_time": accessed_time,
+                        "field": field,
+                        "old_value": old_value,
+                        "new_value": new_value,
+                    }
+                    for listing_id, field, old_value, new_value in listing_changes or []
+                ]
+                for chunk in chunks(change_rows):
+                    await session.execute(insert(ListingChange).values(chunk))
+
+                # Notifications are kept in insertion order by their id.
+                notification_rows = [
+                    {
+                        "channel_id": channel_id,
+                        "dedup_key": dedup_key,
+                        "payload": json.dumps(payload),
+                        "created_time": accessed_time,
+                    }
+                    for channel_id, dedup_key, payload in notifications or []
+                ]
+                for chunk in chunks(notification_rows):
+                    await session.execute(
+                        sqlite_insert(Outbox).values(chunk).on_conflict_do_nothing()
+                    )
+
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - start_time)
+
+        conflicts = [item_id for item_id in new_listings if item_id not in listing_ids]
+
+        for item_id in conflicts:
+            logger.warning("Listing %s conflicts with a saved listing.", item_id)
+
+        logger.debug("Scan saved to the database.")
+
+        return conflicts
+
+    async def get_last_prices(
+        self, nepremicnine_ids: Iterable[str]
+    ) -> dict[str, tuple[int, float, str | None]]:
+        """
+        Returns the listing id, the last price and the content hash of the
+        saved listings with the given nepremicnine ids.
+        :param nepremicnine_ids: Iterable[str]
+        :return: dict[nepremicnine_id, (listing_id, last_price, content_hash)]
+        """
+        nepremicnine_ids = list(nepremicnine_ids)
+        logger.debug("Getting last prices of %d listings.", len(nepremicnine_ids))
+
+        last_prices = {}
+
+        async with self.async_session_factory()() as session:
+            for chunk in chunks(nepremicnine_ids):
+                result: Result = await session.execute(
+                    select(
+                        Listing.nepremicnine_id,
+                        Listing.id,
+                        Listing.last_price,
+                        Listing.content_hash,
+                    ).where(Listing.nepremicnine_id.in_(chunk))
+                )
+                last_prices.update(
+                    (nepremicnine_id, (listing_id, last_price, content_hash))
+                    for nepremicnine_id, listing_id, last_price, content_hash in (
+                        result.all()
+                    )
+                )
+
+        logger.debug("Getting last prices finished.")
+
+        return last_prices
+
+    async def get_listing_contents(self, listing_ids: Iterable[int]) -> dict[int, dict]:
         """
-        Saved a crawled listing to the db.
+        Returns the saved content fields of the given listings.
+        :param listing_ids: Iterable[int]
+        :return: dict[listing_id, content fields]
         """
-        logger.debug("Saving new listing %s to the database.", item_id)
+        listing_ids = list(listing_ids)
+        contents = {}
+
+        async with self.async_session_factory()() as session:
+            for chunk in chunks(listing_ids):
+                result: Result = await session.execute(
+                    select(
+                        Listing.id,
+                        *(getattr(Listing, name) for name in CONTENT_FIELDS),
+                    ).where(Listing.id.in_(chunk))
+                )
+                contents.update(
+                    (row[0], dict(zip(CONTENT_FIELDS, row[1:]))) for row in result.all()
+                )
+
+        return contents
+
+    async def get_band_candidates(
+        self, band_keys: Iterable[tuple[int, int]]
+    ) -> dict[tuple[int, int], list[int]]:
+        """
+        Returns the saved listings in the given LSH band buckets.
+        :param band_keys: (band, bucket) pairs
+        :return: dict[(band, bucket), list of listing ids]
+        """
+        band_keys = list(set(band_keys))
+        candidates = {}
+
+        async with self.async_session_factory()() as session:
+            for chunk in chunks(band_keys):
+                result: Result = await session.execute(
+                    select(
+                        ListingBand.band, ListingBand.bucket, ListingBand.listing_id
+                    ).where(tuple_(ListingBand.band, ListingBand.bucket).in_(chunk))
+                )
+                for band, bucket, listing_id in result.all():
+                    candidates.setdefault((band, bucket), []).append(listing_id)
 
-        _, _, _, prices, _, _, _, url = data
+        return candidates
+
+    async def get_repost_candidates(
+        self, listing_ids: Iterable[int]
+    ) -> dict[int, tuple[bytes, float | None, float, str | None, int | None]]:
+        """
+        Returns the fields of the given listings compared to find reposts.
+        :param listing_ids: Iterable[int]
+        :return: dict[listing_id, (signature, size, last price, image url, original listing id)]
+        """
+        listing_ids = list(listing_ids)
+        candidates = {}
 
         async with self.async_session_factory()() as session:
-            try:
+            for chunk in chunks(listing_ids):
+                result: Result = await session.execute(
+                    select(
+                        Listing.id,
+                        Listing.minhash,
+                        Listing.size,
+                        Listing.last_price,
+                        Listing.image_url,
+                        Listing.duplicate_of,
+                    ).where(Listing.id.in_(chunk), Listing.minhash.is_not(None))
+                )
+                candidates.update((row[0], tuple(row[1:])) for row in result.all())
+
+        return candidates
+
+    async def get_price_columns(
+        self, listing_ids: Iterable[int]
+    ) -> tuple[array, array, array]:
+        """
+        Returns all prices of the given listings as parallel columns,
+        ordered by the listing id and from the oldest to the newest price.
+        Prices of the reposts of a listing are included with the listing id
+        of the original listing.
+        :param listing_ids: Iterable[int]
+        :return: listing ids, unix times and prices
+        """
+        listing_ids = sorted(listing_ids)
+        logger.debug("Getting price history of %d listings.", len(listing_ids))
+
+        columns = (array("q"), array("d"), array("d"))
 
-                listing = Listing(
-                    url=url,
-                    accessed_time=datetime.now(),
-                    nepremicnine_id=item_id,
+        async with self.async_session_factory()() as session:
+            # Chunks of sorted ids keep the columns sorted by the listing id.
+            for chunk in chunks(listing_ids):
+                prices = union_all(
+                    select(
+                        Price.listing_id.label("family_id"),
+                        Price.accessed_time,
+                        Price.price,
+                        Price.id,
+                    ).where(Price.listing_id.in_(chunk)),
+                    select(
+                        Listing.duplicate_of,
+                        Price.accessed_time,
+                        Price.price,
+                        Price.id,
+                    )
+                    .join(Listing, Listing.id == Price.listing_id)
+                    .where(Listing.duplicate_of.in_(chunk)),
+                ).subquery()
+                result: Result = await session.execute(
+                    select(
+                        prices.c.family_id, prices.c.accessed_time, prices.c.price
+                    ).order_by(prices.c.family_id, prices.c.accessed_time, prices.c.id)
                 )
+                for listing_id, accessed_time, price in result.all():
+                    columns[0].append(listing_id)
+                    columns[1].append(accessed_time.timestamp())
+                    columns[2].append(float(price))
+
+        logger.debug("Getting price history finished.")
 
-                session.add(listing)
+        return columns
+
+    async def get_market_listings(
+        self, regions: Iterable[str]
+    ) -> dict[str, dict[str, tuple[float, float]]]:
+        """
+        Returns the last price and the size of the saved listings with a
+        known size in the given regions.
+        :param regions: regions
+        :return: dict[region, dict[nepremicnine_id, (last_price, size)]]
+        """
+        market = {region: {} for region in regions}
 
-                price = Price(accessed_time=datetime.now(), price=prices)
-                session.add(price)
-                listing.prices.append(price)
+        async with self.async_session_factory()() as session:
+            for region in market:
+                result: Result = await session.execute(
+                    select(
+                        Listing.nepremicnine_id, Listing.last_price, Listing.size
+                    ).where(Listing.region == region, Listing.size > 0)
+                )
+                market[region].update(
+                    (nepremicnine_id, (last_price, size))
+                    for nepremicnine_id, last_price, size in result.all()
+                )
 
-                await session.flush()
-                await session.commit()
-                logger.debug("New listing saved to the database.")
-            except exc.SQLAlchemyError as e:
-                await session.rollback()
-                logger.warning("Error saving listing to the database with error: %s", e)
-                # listing: Listing = (
-                #     (
-                #         await session.execute(
-                #             select(Listing).where(Listing.url == listing.url).limit(1)
-                #         )
-                #     )
-                #     .scalars()
-                #     .first()
-                # )
+        return market
 
-    async def get_listings(self):
+    async def search_listings(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        region: str | None,
+        min_price: float | None,
+        max_price: float | None,
+        limit: int,
+        offset: int,
+    ) -> list[tuple[str, str, float, str | None]]:
         """
-        Returns all listings.
+        Returns saved listings filtered by region and last price, from the
+        cheapest. The filters use the region and last price indexes.
+        :param region: region of the search, None for all regions
+        :param min_price: float | None
+        :param max_price: float | None
+        :param limit: maximum number of listings
+        :param offset: number of skipped listings
+        :return: list of (nepremicnine id, url, last price, region)
         """
-        logger.debug("Getting all listings from the database.")
+        conditions = []
+        if region is not None:
+            conditions.append(Listing.region == region)
+        if min_price is not None:
+            conditions.append(Listing.last_price >= min_price)
+        if max_price is not None:
+            conditions.append(Listing.last_price <= max_price)
+
         async with self.async_session_factory()() as session:
-            stmt = (
+            result: Result = await session.execute(
                 select(
                     Listing.nepremicnine_id,
-                    Listing.id,
-                    func.group_concat(Price.price, ",").label("prices"),
+                    Listing.url,
+                    Listing.last_price,
+                    Listing.region,
+                )
+                .where(*conditions)
+                .order_by(Listing.last_price, Listing.id)
+                .limit(limit)
+                .offset(offset)
+            )
+            return [tuple(row) for row in result.all()]
+
+    async def get_listing_history(
+        self, nepremicnine_id: str
+    ) -> tuple[str, list[tuple[datetime, float]]] | None:
+        """
+        Returns the url and all prices of a saved listing, from the oldest.
+        Prices of the original listing and all its reposts are included.
+        :param nepremicnine_id: str
+        :return: (url, list of (accessed time, price)), None if the listing is not saved
+        """
+        async with self.async_session_factory()() as session:
+            listing = (
+                await session.execute(
+                    select(Listing.id, Listing.url, Listing.duplicate_of).where(
+                        Listing.nepremicnine_id == nepremicnine_id
+                    )
+                )
+            ).first()
+            if listing is None:
+                return None
+
+            original_id = listing.duplicate_of or listing.id
+            result: Result = await session.execute(
+                select(Price.accessed_time, Price.price)
+                .where(
+                    Price.listing_id.in_(
+                        select(Listing.id).where(
+                            (Listing.id == original_id)
+                            | (Listing.duplicate_of == original_id)
+                        )
+                    )
+                )
+                .order_by(Price.accessed_time, Price.id)
+            )
+            return listing.url, [
+                (accessed_time, float(price)) for accessed_time, price in result.all()
+            ]
+
+    async def get_region_stats(
+        self, region: str | None
+    ) -> list[tuple[str | None, int, float, float, float]]:
+        """
+        Returns the number of saved listings and their lowest, average and
+        highest last price by region, from the region with the most listings.
+        :param region: single region, None for all regions
+        :return: list of (region, count, min price, average price, max price)
+        """
+        listing_count = func.count(Listing.id)  # pylint: disable=not-callable
+        statement = (
+            select(
+                Listing.region,
+                listing_count,
+                func.min(Listing.last_price),
+                func.avg(Listing.last_price),
+                func.max(Listing.last_price),
+            )
+            .group_by(Listing.region)
+            .order_by(listing_count.desc())
+        )
+        if region is not None:
+            statement = statement.where(Listing.region == region)
+
+        async with self.async_session_factory()() as session:
+            result: Result = await session.execute(statement)
+            return [tuple(row) for row in result.all()]
+
+    async def get_cached_details(
+        self, keys: Iterable[tuple[str, str]]
+    ) -> set[tuple[str, str]]:
+        """
+        Returns the keys with cached listing details.
+        :param keys: (nepremicnine id, content hash) pairs
+        :return: set of (nepremicnine id, content hash)
+        """
+        keys = list(keys)
+        cached = set()
+
+        async with self.async_session_factory()() as session:
+            for chunk in chunks(keys):
+                result: Result = await session.execute(
+                    select(
+                        ListingDetail.nepremicnine_id, ListingDetail.content_hash
+                    ).where(
+                        ListingDetail.nepremicnine_id.in_(
+                            [nepremicnine_id for nepremicnine_id, _ in chunk]
+                        )
+                    )
+                )
+                cached.update(tuple(row) for row in result.all())
+
+        return cached & set(keys)
+
+    async def save_details(
+        self, nepremicnine_id: str, content_hash: str, details: dict
+    ):
+        """
+        Caches the details of a listing and drops the details of its
+        previous content.
+        :param nepremicnine_id: str
+        :param content_hash: str
+        :param details: dict
+        :return:
+        """
+        async with self.async_session_factory()() as session:
+            async with session.begin():
+                await session.execute(
+                    delete(ListingDetail).where(
+                        ListingDetail.nepremicnine_id == nepremicnine_id,
+                        ListingDetail.content_hash != content_hash,
+                    )
+                )
+                await session.execute(
+                    sqlite_insert(ListingDetail)
+                    .values(
+                        nepremicnine_id=nepremicnine_id,
+                        content_hash=content_hash,
+                        details=json.dumps(details),
+                        fetched_time=datetime.now(),
+                    )
+                    .on_conflict_do_nothing()
+                )
+
+    async def get_details(self, nepremicnine_id: str) -> dict | None:
+        """
+        Returns the cached details of the latest content of a listing.
+        :param nepremicnine_id: str
+        :return: dict, None if the details were not loaded
+        """
+        async with self.async_session_factory()() as session:
+            details = (
+                await session.execute(
+                    select(ListingDetail.details)
+                    .join(
+                        Listing,
+                        (Listing.nepremicnine_id == ListingDetail.nepremicnine_id)
+                        & (Listing.content_hash == ListingDetail.content_hash),
+                    )
+                    .where(ListingDetail.nepremicnine_id == nepremicnine_id)
                 )
-                .join(Price, Listing.id == Price.listing_id)
-                .group_by(Listing.id)
-                .order_by(Price.accessed_time.asc())
+            ).scalar_one_or_none()
+            return json.loads(details) if details is not None else None
+
+    async def get_pending_notifications(
+        self, exclude_ids: Iterable[int], max_attempts: int, limit: int
+    ) -> list[tuple[int, str, dict]]:
+        """
+        Returns the oldest undelivered notifications.
+        :param exclude_ids: ids of notifications that are already being delivered
+        :param max_attempts: notifications with more failed attempts are skipped
+        :param limit: maximum number of notifications
+        :return: list of (id, channel id, payload)
+        """
+        logger.debug("Getting pending notifications.")
+        async with self.async_session_factory()() as session:
+            result: Result = await session.execute(
+                select(Outbox.id, Outbox.channel_id, Outbox.payload)
+                .where(
+                    Outbox.delivered_time.is_(None),
+                    Outbox.attempts < max_attempts,
+                    Outbox.id.not_in(list(exclude_ids)),
+                )
+                .order_by(Outbox.id)
+                .limit(limit)
             )
-            result: Result = await session.execute(stmt)
-            logger.debug("Getting all listings with prices finished.")
+            return [
+                (notification_id, channel_id, json.loads(payload))
+                for notification_id, channel_id, payload in result.all()
+            ]
+
+    async def mark_notifications_delivered(self, notification_ids: list[int]):
+        """
+        Marks the notifications as delivered.
+        :param notification_ids: list[int]
+        :return:
+        """
+        async with self.async_session_factory()() as session:
+            async with session.begin():
+                await session.execute(
+                    update(Outbox)
+                    .where(Outbox.id.in_(notification_ids))
+                    .values(delivered_time=datetime.now())
+                )
+
+    async def record_notification_failure(self, notification_ids: list[int]):
+        """
+        Increases the failed delivery attempts of the notifications.
+        :param notification_ids: list[int]
+        :return:
+        """
+        async with self.async_session_factory()() as session:
+            async with session.begin():
+                await session.execute(
+                    update(Outbox)
+                    .where(Outbox.id.in_(notification_ids))
+                    .values(attempts=Outbox.attempts + 1)
+                )
 
-            # Convert the comma-separated string back to a list of prices
-            listings_with_prices = {
-                item[0]: (
-                    item[1],
-                    [float(price) for price in item[2].split(",")] if item[2] else [],
+    async def delete_delivered_notifications(self, older_than: timedelta) -> int:
+        """
+        Deletes notifications delivered before the given time span.
+        :param older_than: timedelta
+        :return: number of deleted notifications
+        """
+        async with self.async_session_factory()() as session:
+            async with session.begin():
+                result = await session.execute(
+                    delete(Outbox).where(
+                        Outbox.delivered_time < datetime.now() - older_than
+                    )
                 )
-                for item in result.all()
-            }
+                return result.rowcount
+
 
-            # return a dictionary of listings. Use id as the key and prices as the value.
-            return listings_with_prices
+def chunks(rows: list, size: int = INSERT_CHUNK_SIZE):
+    """
+    Splits rows into chunks, so inserts stay below the SQLite variable limit.
+    :param rows: list
+    :param size: int
+    :return:
+    """
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def set_sqlite_pragmas(dbapi_connection, _connection_record):
+    """
+    Sets the tuned pragmas on a new SQLite connection.
+    """
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def start_query_timer(
+    conn, _cursor, _statement, _parameters, _context, _executemany
+):  # pylint: disable=too-many-arguments
+    """
+    Remembers the start time of a query.
+    """
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
@@ -0,0 +1,223 @@
+"""
+Database schema migrations.
+Each migration upgrades the schema by one version. The current version is
+stored in the SQLite `user_version` pragma, so an existing database file is
+upgraded in place.
+"""
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from logger.logger import logger
+
+# List of (version, description, statements). New migrations are appended.
+MIGRATIONS = [
+    (
+        1,
+        "Create listing and price tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS listing (
+                id INTEGER NOT NULL,
+                nepremicnine_id VARCHAR(50),
+                url VARCHAR(150),
+                accessed_time DATETIME,
+                PRIMARY KEY (id),
+                UNIQUE (nepremicnine_id),
+                UNIQUE (url)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS price (
+                id INTEGER NOT NULL,
+                price INTEGER,
+                accessed_time DATETIME,
+                listing_id INTEGER,
+                PRIMARY KEY (id),
+                FOREIGN KEY(listing_id) REFERENCES listing (id)
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "Add price indexes",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS ix_price_listing_id_accessed_time
+            ON price (listing_id, accessed_time)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_price_accessed_time
+            ON price (accessed_time)
+            """,
+        ],
+    ),
+    (
+        3,
+        "Add the last price of a listing",
+        [
+            "ALTER TABLE listing ADD COLUMN last_price FLOAT",
+            """
+            UPDATE listing SET last_price = (
+                SELECT price.price FROM price
+                WHERE price.listing_id = listing.id
+                ORDER BY price.accessed_time DESC, price.id DESC
+                LIMIT 1
+            )
+            """,
+        ],
+    ),
+    (
+        4,
+        "Add notification outbox",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER NOT NULL,
+                channel_id VARCHAR(30) NOT NULL,
+                dedup_key VARCHAR(300) NOT NULL,
+                payload TEXT NOT NULL,
+                created_time DATETIME,
+                delivered_time DATETIME,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (id),
+                UNIQUE (dedup_key)
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_outbox_pending
+            ON outbox (id) WHERE delivered_time IS NULL
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_outbox_delivered_time
+            ON outbox (delivered_time)
+            """,
+        ],
+    ),
+    (
+        5,
+        "Add listing region and price search indexes",
+        [
+            "ALTER TABLE listing ADD COLUMN region VARCHAR(100)",
+            """
+            CREATE INDEX IF NOT EXISTS ix_listing_region_last_price
+            ON listing (region, last_price)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_listing_last_price
+            ON listing (last_price)
+            """,
+        ],
+    ),
+    (
+        6,
+        "Add listing size",
+        [
+            "ALTER TABLE listing ADD COLUMN size FLOAT",
+        ],
+    ),
+    (
+        7,
+        "Add listing attributes and change history",
+        [
+            "ALTER TABLE listing ADD COLUMN title VARCHAR(300)",
+            "ALTER TABLE listing ADD COLUMN description TEXT",
+            "ALTER TABLE listing ADD COLUMN year INTEGER",
+            "ALTER TABLE listing ADD COLUMN floor VARCHAR(50)",
+            "ALTER TABLE listing ADD COLUMN image_url VARCHAR(300)",
+            "ALTER TABLE listing ADD COLUMN content_hash VARCHAR(32)",
+            """
+            CREATE TABLE IF NOT EXISTS listing_change (
+                id INTEGER NOT NULL,
+                listing_id INTEGER NOT NULL,
+                accessed_time DATETIME,
+                field VARCHAR(50) NOT NULL,
+                old_value TEXT,
+                new_value TEXT,
+                PRIMARY KEY (id),
+                FOREIGN KEY(listing_id) REFERENCES listing (id)
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_listing_change_listing_id
+            ON listing_change (listing_id)
+            """,
+        ],
+    ),
+    (
+        8,
+        "Add listing detail cache",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS listing_detail (
+                nepremicnine_id VARCHAR(50) NOT NULL,
+                content_hash VARCHAR(32) NOT NULL,
+                details TEXT NOT NULL,
+                fetched_time DATETIME,
+                PRIMARY KEY (nepremicnine_id, content_hash)
+            )
+            """,
+        ],
+    ),
+    (
+        9,
+        "Add repost detection index",
+        [
+            "ALTER TABLE listing ADD COLUMN minhash BLOB",
+            "ALTER TABLE listing ADD COLUMN duplicate_of INTEGER REFERENCES listing (id)",
+            """
+            CREATE TABLE IF NOT EXISTS listing_band (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                listing_id INTEGER NOT NULL,
+                PRIMARY KEY (band, bucket, listing_id),
+                FOREIGN KEY(listing_id) REFERENCES listing (id)
+            )
+            """,
+        ],
+    ),
+    (
+        10,
+        "Key listing regions by listing and property type",
+        [
+            # Regions without the listing and property type mixed markets,
+            # listings get their new region when they are crawled again.
+            "UPDATE listing SET region = NULL",
+        ],
+    ),
+]
+
+
+async def migrate(engine: AsyncEngine) -> int:
+    """
+    Applies all migrations newer than the database schema version.
+    Every migration runs in its own transaction together with the version update,
+    so a failed migration leaves the schema at the previous version.
+    :param engine: AsyncEngine
+    :return: the schema version
+    """
+    async with engine.connect() as conn:
+        version = (await conn.execute(text("PRAGMA user_version"))).scalar_one()
+
+    logger.debug("Database schema version is %d.", version)
+
+    for migration_version, description, statements in MIGRATIONS:
+        if migration_version <= version:
+            continue
+
+        logger.info(
+            "Migrating database to version %d: %s.", migration_version, description
+        )
+
+        async with engine.begin() as conn:
+            # The sqlite driver only begins a transaction before DML, without
+            # an explicit BEGIN every DDL statement is committed on its own.
+            await conn.exec_driver_sql("BEGIN")
+            for statement in statements:
+                await conn.execute(text(statement))
+            await conn.execute(text(f"PRAGMA user_version = {migration_version}"))
+
+        version = migration_version
+
+    return version
@@ -9,10 +9,15 @@ from typing import List
 from sqlalchemy import (
     Column,
     Integer,
+    Float,
     String,
+    Text,
+    LargeBinary,
     DateTime,
     MetaData,
     ForeignKey,
+    Index,
+    text,
 )
 from sqlalchemy.orm import declarative_base, Mapped, relationship
 
@@ -43,14 +48,36 @@ class PropertyType(enum.Enum):
 class Listing(Base):
     """
     A search results table. It stores found apartments and houses.
+    The schema is created and upgraded by database.migrations.
     """
 
     __tablename__ = "listing"
+    __table_args__ = (
+        Index("ix_listing_region_last_price", "region", "last_price"),
+        Index("ix_listing_last_price", "last_price"),
+    )
 
     id: Mapped[int] = Column(Integer, primary_key=True, autoincrement=True)
     nepremicnine_id: Mapped[str] = Column(String(50), unique=True)
     url: Mapped[str] = Column(String(150), unique=True)
     accessed_time = Column(DateTime)
+    # Denormalized latest price, so lookups do not need the price table.
+    last_price: Mapped[float] = Column(Float)
+    # Market of the search the listing was first found with, see spider.planner.Search.
+    region: Mapped[str] = Column(String(100))
+    # Size in m², used for the price per m².
+    size: Mapped[float] = Column(Float)
+    title: Mapped[str] = Column(String(300))
+    description: Mapped[str] = Column(Text)
+    year: Mapped[int] = Column(Integer)
+    floor: Mapped[str] = Column(String(50))
+    image_url: Mapped[str] = Column(String(300))
+    # Hash of the content fields, see common.listing.ListingRecord.content_hash.
+    content_hash: Mapped[str] = Column(String(32))
+    # MinHash signature of the title and description, see services.dedup_service.
+    minhash: Mapped[bytes] = Column(LargeBinary)
+    # Original listing of a repost.
+    duplicate_of: Mapped[int] = Column(ForeignKey("listing.id"))
     prices: Mapped[List["Price"]] = relationship(lazy="selectin")
 
 
@@ -60,8 +87,76 @@ class Price(Base):
     """
 
     __tablename__ = "price"
+    __table_args__ = (
+        Index("ix_price_listing_id_accessed_time", "listing_id", "accessed_time"),
+    )
 
     id: Mapped[int] = Column(Integer, primary_key=True, autoincrement=True)
     price: Mapped[float] = Column(Integer, unique=False)
-    accessed_time = Column(DateTime)
+    accessed_time = Column(DateTime, index=True)
     listing_id: Mapped[int] = Column(ForeignKey("listing.id"))
+
+
+class ListingChange(Base):
+    """
+    A table that stores the changed fields of a listing.
+    """
+
+    __tablename__ = "listing_change"
+
+    id: Mapped[int] = Column(Integer, primary_key=True, autoincrement=True)
+    listing_id: Mapped[int] = Column(ForeignKey("listing.id"), index=True)
+    accessed_time = Column(DateTime)
+    field: Mapped[str] = Column(String(50), nullable=False)
+    old_value: Mapped[str] = Column(Text)
+    new_value: Mapped[str] = Column(Text)
+
+
+class ListingBand(Base):
+    """
+    A table that indexes the listings by the LSH bands of their signature,
+    so the candidates of a repost are found without comparing all listings.
+    """
+
+    __tablename__ = "listing_band"
+
+    band: Mapped[int] = Column(Integer, primary_key=True)
+    bucket: Mapped[int] = Column(Integer, primary_key=True)
+    listing_id: Mapped[int] = Column(ForeignKey("listing.id"), primary_key=True)
+
+
+class ListingDetail(Base):
+    """
+    A table that caches the details loaded from the listing page.
+    Details are kept for the latest content hash of a listing.
+    """
+
+    __tablename__ = "listing_detail"
+
+    nepremicnine_id: Mapped[str] = Column(String(50), primary_key=True)
+    content_hash: Mapped[str] = Column(String(32), primary_key=True)
+    details: Mapped[str] = Column(Text, nullable=False)
+    fetched_time = Column(DateTime)
+
+
+class Outbox(Base):
+    """
+    A table that stores discord notifications until they are delivered.
+    """
+
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index(
+            "ix_outbox_pending",
+            "id",
+            sqlite_where=text("delivered_time IS NULL"),
+        ),
+    )
+
+    id: Mapped[int] = Column(Integer, primary_key=True, autoincrement=True)
+    channel_id: Mapped[str] = Column(String(30), nullable=False)
+    dedup_key: Mapped[str] = Column(String(300), unique=True, nullable=False)
+    payload: Mapped[str] = Column(Text, nullable=False)
+    created_time = Column(DateTime)
+    delivered_time = Column(DateTime, index=True)
+    attempts: Mapped[int] = Column(Integer, nullable=False, default=0)
@@ -1,13 +1,19 @@
 """Module that logging logic."""
 
+import atexit
+import json
 import logging
 import logging.handlers
+import queue
 import re
 import sys
+from datetime import datetime, timezone
 from enum import Enum
 
 import urllib3
 
+from common.constants import DEFAULT_LOG_FORMAT, DEFAULT_LOG_LEVEL
+
 
 class ColorCodes(Enum):
     """
@@ -153,32 +159,88 @@ class BraceFormatStyleFormatter(logging.Formatter):
         return formatted
 
 
-def init_logging():
+class JsonFormatter(logging.Formatter):
+    """
+    A formatter that writes every log record as a single line JSON object.
+    """
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that leaves all formatting to the listener thread.
+    The default handler merges the message arguments in the logging thread,
+    the queue is in-process, so the record can be passed as it is.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+# Listener writing the queued records, replaced on every init_logging call.
+listener: logging.handlers.QueueListener | None = None
+
+
+def stop_logging():
+    """
+    Writes the queued records and stops the listener thread.
+    :return:
+    """
+    global listener  # pylint: disable=global-statement
+
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def init_logging(level: str = DEFAULT_LOG_LEVEL, log_format: str = DEFAULT_LOG_FORMAT):
     """
     Initializes logging.
+    Records are put on a queue and formatted and written to stdout by a
+    background thread, so the event loop does not wait on the console.
+    Can be called again to apply new settings.
+    :param level: name of the log level
+    :param log_format: "text" or "json"
     :return:
     """
-    level = logging.INFO
+    global listener  # pylint: disable=global-statement
+
+    stop_logging()
+
     root_logger = logging.getLogger()
-    root_logger.setLevel(level)
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.setLevel(level.upper())
 
-    console_level = "INFO"
     console_handler = logging.StreamHandler(stream=sys.stdout)
-    console_handler.setLevel(console_level)
-    console_format = "[%(asctime)s %(threadName)s %(levelname)s] %(message)s"
-    colored_formatter = ColorizedArgsFormatter(console_format)
-    console_handler.setFormatter(colored_formatter)
-    root_logger.addHandler(console_handler)
+    if log_format == "json":
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_format = "[%(asctime)s %(threadName)s %(levelname)s] %(message)s"
+        console_handler.setFormatter(ColorizedArgsFormatter(console_format))
 
     # file_handler = logging.FileHandler(filename="app.log", encoding="utf-8", mode="w")
-    # file_level = "DEBUG"
-    # file_handler.setLevel(file_level)
     # file_format = "[%(asctime)s %(threadName)s, %(levelname)s] %(message)s"
     # file_handler.setFormatter(BraceFormatStyleFormatter(file_format))
-    # root_logger.addHandler(file_handler)
-    logging.basicConfig(level=level, format=console_format)
+
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(LazyQueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, console_handler)
+    listener.start()
 
 
+atexit.register(stop_logging)
 init_logging()
 logger = logging.getLogger(__name__)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
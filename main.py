@@ -5,39 +5,121 @@ import os
 
 from dotenv import load_dotenv
 
+from common.constants import (
+    DEFAULT_BROWSER_CACHE_DIR,
+    DEFAULT_BROWSER_MAX_MEMORY_MB,
+    DEFAULT_BROWSER_MAX_SCANS,
+    DEFAULT_ENRICHMENT_BUDGET,
+    DEFAULT_ENRICHMENT_CONCURRENCY,
+    DEFAULT_LOG_FORMAT,
+    DEFAULT_LOG_LEVEL,
+    DEFAULT_METRICS_HOST,
+    DEFAULT_SCHEDULER_JITTER,
+    DEFAULT_SCHEDULER_MAX_INTERVAL,
+    DEFAULT_SCHEDULER_MIN_INTERVAL,
+    DEFAULT_SPIDER_CONCURRENCY,
+    DEFAULT_SPIDER_FETCH_MODE,
+    DEFAULT_SPIDER_FULL_SWEEP_EVERY,
+    DEFAULT_SPIDER_HOST_DELAY,
+    DEFAULT_SPIDER_INCREMENTAL,
+    DEFAULT_SPIDER_PAGE_WINDOW,
+)
 from database.database_manager import DatabaseManager
-from logger.logger import logger
+from logger.logger import init_logging, logger
+from services.config_service import ConfigError, load_config
 from services.discord_service import MyDiscordClient
 
 
-def load_env() -> tuple[str, str]:
+def load_env() -> tuple[str, str, dict]:
     """
     Loads ENV variables.
-    :return: discord_token, database_path
+    :return: discord_token, database_path, client_options
     """
     load_dotenv()
+
+    # Logging is set up on import, apply the loaded settings.
+    init_logging(
+        level=os.getenv("LOG_LEVEL", DEFAULT_LOG_LEVEL),
+        log_format=os.getenv("LOG_FORMAT", DEFAULT_LOG_FORMAT),
+    )
+
     discord_token = os.getenv("DISCORD_TOKEN")
     database_path = os.getenv("DB_PATH")
-    return discord_token, database_path
+    spider_options = {
+        "concurrency": int(
+            os.getenv("SPIDER_CONCURRENCY", str(DEFAULT_SPIDER_CONCURRENCY))
+        ),
+        "host_delay": float(
+            os.getenv("SPIDER_HOST_DELAY", str(DEFAULT_SPIDER_HOST_DELAY))
+        ),
+        "page_window": int(
+            os.getenv("SPIDER_PAGE_WINDOW", str(DEFAULT_SPIDER_PAGE_WINDOW))
+        ),
+        "fetch_mode": os.getenv("SPIDER_FETCH_MODE", DEFAULT_SPIDER_FETCH_MODE),
+        "incremental": os.getenv(
+            "SPIDER_INCREMENTAL", str(DEFAULT_SPIDER_INCREMENTAL)
+        ).lower()
+        in ("1", "true", "yes"),
+    }
+    browser_options = {
+        "max_scans": int(
+            os.getenv("BROWSER_MAX_SCANS", str(DEFAULT_BROWSER_MAX_SCANS))
+        ),
+        "max_memory_mb": int(
+            os.getenv("BROWSER_MAX_MEMORY_MB", str(DEFAULT_BROWSER_MAX_MEMORY_MB))
+        ),
+        "block_resources": os.getenv("BROWSER_BLOCK_RESOURCES", "true").lower()
+        in ("1", "true", "yes"),
+        "cache_dir": os.getenv("BROWSER_CACHE_DIR", DEFAULT_BROWSER_CACHE_DIR) or None,
+    }
+    scheduler_options = {
+        "min_interval": float(
+            os.getenv("SCHEDULER_MIN_INTERVAL", str(DEFAULT_SCHEDULER_MIN_INTERVAL))
+        ),
+        "max_interval": float(
+            os.getenv("SCHEDULER_MAX_INTERVAL", str(DEFAULT_SCHEDULER_MAX_INTERVAL))
+        ),
+        "jitter": float(os.getenv("SCHEDULER_JITTER", str(DEFAULT_SCHEDULER_JITTER))),
+        "full_sweep_every": int(
+            os.getenv("SPIDER_FULL_SWEEP_EVERY", str(DEFAULT_SPIDER_FULL_SWEEP_EVERY))
+        ),
+    }
+    metrics_options = {
+        "host": os.getenv("METRICS_HOST", DEFAULT_METRICS_HOST),
+        "port": int(os.getenv("METRICS_PORT") or 0),
+    }
+    enrichment_options = {
+        "enabled": os.getenv("ENRICHMENT_ENABLED", "false").lower()
+        in ("1", "true", "yes"),
+        "concurrency": int(
+            os.getenv("ENRICHMENT_CONCURRENCY", str(DEFAULT_ENRICHMENT_CONCURRENCY))
+        ),
+        "budget": int(os.getenv("ENRICHMENT_BUDGET", str(DEFAULT_ENRICHMENT_BUDGET))),
+    }
+    client_options = {
+        "spider_options": spider_options,
+        "browser_options": browser_options,
+        "scheduler_options": scheduler_options,
+        "metrics_options": metrics_options,
+        "enrichment_options": enrichment_options,
+    }
+    return discord_token, database_path, client_options
 
 
 async def setup_db(database_path: str):
     """
     Sets up the database.
+    Creates a new database or upgrades the existing one in place.
     :param database_path: str
     :return:
     """
     logger.debug("DB setup started.")
 
-    # Delete existing database if it exists.
-    if os.path.exists(database_path):
-        os.remove(database_path)
-
     # Setup database manager.
     database_manager = DatabaseManager(url="sqlite+aiosqlite:///" + database_path)
 
-    # Create database tables.
-    await database_manager.create_models()
+    # Create or upgrade database tables.
+    await database_manager.migrate()
 
     # Clean database manager.
     await database_manager.cleanup()
@@ -52,17 +134,19 @@ def main():
     logger.info("Application started.")
 
     # Load env variables.
-    discord_token, database_path = load_env()
+    discord_token, database_path, client_options = load_env()
 
-    # Setup database if it does not exist.
-    if not os.path.exists(database_path):
-        logger.debug("Database does not exist. Setting up database.")
-        asyncio.run(setup_db(database_path))
+    # Validate the config before starting the bot.
+    try:
+        load_config()
+    except (ConfigError, OSError) as e:
+        logger.error("Invalid config: %s", e)
+        return
 
-    else:
-        logger.debug("Database already exists.")
+    # Setup or upgrade the database.
+    asyncio.run(setup_db(database_path))
 
-    discord_client = MyDiscordClient(database_path=database_path)
+    discord_client = MyDiscordClient(database_path=database_path, **client_options)
     discord_client.run(token=discord_token, log_handler=None)
 
     logger.info("Application finished.")
@@ -0,0 +1,220 @@
+"""
+Module that contains price analytics logic.
+Prices are held in columnar arrays and every metric is computed for all
+listings in a single pass over the columns.
+"""
+
+import math
+import statistics
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from common.constants import ANALYTICS_MIN_BASELINE_LISTINGS
+from common.listing import ListingRecord
+from database.database_manager import DatabaseManager
+from logger.logger import logger
+
+NAN = float("nan")
+
+
+class PriceColumns:
+    """
+    Price history of many listings as parallel arrays, ordered by the
+    listing id and the time of the price.
+    """
+
+    def __init__(self, listing_ids: array, times: array, prices: array):
+        self.listing_ids = listing_ids
+        self.times = times
+        self.prices = prices
+
+    def bounds(self, listing_id: int) -> tuple[int, int]:
+        """
+        Returns the slice of the columns with the prices of the listing.
+        :param listing_id: int
+        :return: (start, end)
+        """
+        return bisect_left(self.listing_ids, listing_id), bisect_right(
+            self.listing_ids, listing_id
+        )
+
+    def history(self, listing_id: int) -> array | None:
+        """
+        Returns the prices of the listing, from the oldest.
+        :param listing_id: int
+        :return: array, None if the listing has no saved prices
+        """
+        start, end = self.bounds(listing_id)
+        return self.prices[start:end] if end > start else None
+
+    def first_time(self, listing_id: int) -> float:
+        """
+        Returns the time of the first saved price of the listing.
+        :param listing_id: int
+        :return: unix time, NaN if the listing has no saved prices
+        """
+        start, end = self.bounds(listing_id)
+        return self.times[start] if end > start else NAN
+
+
+class MarketBaseline:  # pylint: disable=too-few-public-methods
+    """
+    Distribution of the price per m² of the listings of a region.
+    """
+
+    def __init__(self, values: array):
+        quartiles = statistics.quantiles(values, n=4)
+        self.count = len(values)
+        self.p25 = quartiles[0]
+        self.median = quartiles[1]
+        self.p75 = quartiles[2]
+
+
+def price_per_m2(prices: array, sizes: array) -> array:
+    """
+    Returns the price per m² for every listing, NaN if the size is unknown.
+    :param prices: array
+    :param sizes: array
+    :return: array
+    """
+    return array(
+        "d",
+        (price / size if size > 0 else NAN for price, size in zip(prices, sizes)),
+    )
+
+
+def percent_drops(previous: array, current: array) -> array:
+    """
+    Returns the drop from the previous to the current value in percent,
+    negative for an increase and NaN if there is no previous value.
+    :param previous: array
+    :param current: array
+    :return: array
+    """
+    return array(
+        "d",
+        (
+            (old - new) / old * 100 if old > 0 else NAN
+            for old, new in zip(previous, current)
+        ),
+    )
+
+
+def market_baselines(
+    market: dict[str, dict[str, tuple[float, float]]],
+) -> dict[str, MarketBaseline]:
+    """
+    Computes the price per m² baseline of every region with enough listings.
+    :param market: (price, size) of the listings by nepremicnine id by region
+    :return: dict[region, MarketBaseline]
+    """
+    baselines = {}
+
+    for region, listings in market.items():
+        values = price_per_m2(
+            array("d", (price for price, _ in listings.values())),
+            array("d", (size for _, size in listings.values())),
+        )
+        values = array("d", (value for value in values if not math.isnan(value)))
+        if len(values) >= ANALYTICS_MIN_BASELINE_LISTINGS:
+            baselines[region] = MarketBaseline(values)
+
+    return baselines
+
+
+async def analyze_listings(  # pylint: disable=too-many-locals
+    database_manager: DatabaseManager,
+    listings: list[ListingRecord],
+    listing_ids: list[int | None],
+    price_columns: PriceColumns,
+    crawled_listings: dict[str, ListingRecord],
+):
+    """
+    Computes the price per m², the price drops, the time on market, the
+    difference to the median price per m² of the region and the quartiles
+    of the price per m² of the region for all listings, and attaches them
+    to the listings.
+    The listings must have their price history attached.
+    :param database_manager: DatabaseManager
+    :param listings: found listings
+    :param listing_ids: saved listing id of every listing, None for a new listing
+    :param price_columns: price history of the saved listings
+    :param crawled_listings: all listings of the scan by nepremicnine id
+    :return:
+    """
+    if not listings:
+        return
+
+    # Market of a region are the saved listings and the listings of this scan.
+    # Listings without a region have no market.
+    regions = {listing.region for listing in listings} - {None}
+    market = await database_manager.get_market_listings(regions)
+    for nepremicnine_id, listing in crawled_listings.items():
+        if listing.region in market:
+            market[listing.region][nepremicnine_id] = (listing.price, listing.size)
+    baselines = market_baselines(market)
+
+    now = time.time()
+
+    prices = array("d", (listing.price for listing in listings))
+    unit_prices = price_per_m2(
+        prices, array("d", (listing.size for listing in listings))
+    )
+    drops = percent_drops(
+        array(
+            "d",
+            (
+                listing.prices[-2] if len(listing.prices) > 1 else NAN
+                for listing in listings
+            ),
+        ),
+        prices,
+    )
+    total_drops = percent_drops(
+        array("d", (max(listing.prices) for listing in listings)), prices
+    )
+    days_on_market = array(
+        "d",
+        (
+            (
+                (now - price_columns.first_time(listing_id)) / 86400
+                if listing_id is not None
+                else 0.0
+            )
+            for listing_id in listing_ids
+        ),
+    )
+    medians, lower_quartiles, upper_quartiles = (
+        array(
+            "d",
+            (
+                (
+                    getattr(baselines[listing.region], name)
+                    if listing.region in baselines
+                    else NAN
+                )
+                for listing in listings
+            ),
+        )
+        for name in ("median", "p25", "p75")
+    )
+    market_differences = percent_drops(medians, unit_prices)
+
+    for index, listing in enumerate(listings):
+        listing.analytics = {
+            name: None if math.isnan(column[index]) else round(column[index], 2)
+            for name, column in (
+                ("price_per_m2", unit_prices),
+                ("drop", drops),
+                ("total_drop", total_drops),
+                ("days_on_market", days_on_market),
+                ("below_market", market_differences),
+                ("market_p25", lower_quartiles),
+                ("market_p75", upper_quartiles),
+            )
+        }
+
+    logger.debug(
+        "Analyzed %d listings with %d market baselines.", len(listings), len(baselines)
+    )
@@ -0,0 +1,162 @@
+"""Module that contains browser lifecycle logic."""
+
+import asyncio
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Playwright
+
+from common.constants import (
+    DEFAULT_BROWSER_CACHE_DIR,
+    DEFAULT_BROWSER_MAX_MEMORY_MB,
+    DEFAULT_BROWSER_MAX_SCANS,
+    USER_AGENT,
+)
+from logger.logger import logger
+from services.metrics_service import BROWSER_RSS_BYTES
+from util.util import descendant_rss, RequestInterceptor
+
+
+class BrowserManager:  # pylint: disable=too-many-instance-attributes
+    """
+    Keeps one warm browser and its contexts across scans.
+    The browser is launched on first use, so scans that do not need it
+    never start it. It is restarted if it crashes and recycled after
+    `max_scans` scans or when its processes use more than `max_memory_mb`.
+    Unless `block_resources` is disabled, requests of all contexts go through
+    a request interceptor.
+    """
+
+    def __init__(
+        self,
+        max_scans: int = DEFAULT_BROWSER_MAX_SCANS,
+        max_memory_mb: int = DEFAULT_BROWSER_MAX_MEMORY_MB,
+        block_resources: bool = True,
+        cache_dir: str | None = DEFAULT_BROWSER_CACHE_DIR,
+    ):
+        self.max_scans = max_scans
+        self.max_memory_mb = max_memory_mb
+        self.interceptor = (
+            RequestInterceptor(cache_dir=cache_dir) if block_resources else None
+        )
+        self.playwright: Playwright | None = None
+        self.browser: Browser | None = None
+        self.contexts: dict[str, BrowserContext] = {}
+        # Names of the contexts in which the cookie consent dialog was handled.
+        self.consented_contexts: set[str] = set()
+        self.scans = 0
+        self.lock = asyncio.Lock()
+
+    async def get_browser(self) -> Browser:
+        """
+        Returns a healthy browser and (re)launches it if needed.
+        :return: Browser
+        """
+        async with self.lock:
+            if self.browser is not None and not self.browser.is_connected():
+                logger.warning("Browser is not connected anymore. Restarting it.")
+                await self._close_browser()
+
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+
+            if self.browser is None:
+                logger.info("Launching the browser.")
+                self.browser = await self.playwright.chromium.launch(headless=False)
+                self.scans = 0
+
+            return self.browser
+
+    async def get_context(self, name: str = "default") -> BrowserContext:
+        """
+        Returns a reusable browser context with the given name.
+        :param name: str
+        :return: BrowserContext
+        """
+        browser = await self.get_browser()
+
+        async with self.lock:
+            context = self.contexts.get(name)
+            if context is None or context.browser is not browser:
+                logger.debug("Creating browser context %s.", name)
+                context = await browser.new_context(user_agent=USER_AGENT)
+                if self.interceptor is not None:
+                    # Prevent loading some resources for better performance.
+                    await context.route("**/*", self.interceptor.handle)
+                self.contexts[name] = context
+                self.consented_contexts.discard(name)
+            return context
+
+    def cookies_rejected(self, name: str) -> bool:
+        """
+        Returns True if the cookies were already rejected in the named context.
+        :param name: str
+        :return: bool
+        """
+        return name in self.consented_contexts
+
+    def mark_cookies_rejected(self, name: str):
+        """
+        Remembers that the cookies were rejected in the named context.
+        :param name: str
+        :return:
+        """
+        self.consented_contexts.add(name)
+
+    async def scan_finished(self):
+        """
+        Recycles the browser if it was used for too many scans or uses
+        too much memory.
+        :return:
+        """
+        async with self.lock:
+            if self.browser is None:
+                return
+
+            if self.interceptor is not None:
+                self.interceptor.log_stats()
+
+            self.scans += 1
+
+            memory = descendant_rss()
+            memory_mb = memory / 1024 / 1024 if memory is not None else 0
+            BROWSER_RSS_BYTES.set(memory or 0)
+
+            logger.debug(
+                "Browser was used for %d scans and uses %.0f MB.",
+                self.scans,
+                memory_mb,
+            )
+
+            if self.scans >= self.max_scans or memory_mb > self.max_memory_mb:
+                BROWSER_RSS_BYTES.set(0)
+                logger.info(
+                    "Recycling the browser after %d scans using %.0f MB.",
+                    self.scans,
+                    memory_mb,
+                )
+                await self._close_browser()
+
+    async def close(self):
+        """
+        Closes the browser and stops playwright.
+        :return:
+        """
+        async with self.lock:
+            await self._close_browser()
+            if self.playwright is not None:
+                await self.playwright.stop()
+                self.playwright = None
+
+    async def _close_browser(self):
+        """
+        Closes the browser and its contexts, ignoring errors of a crashed browser.
+        :return:
+        """
+        self.contexts.clear()
+        self.consented_contexts.clear()
+        if self.browser is not None:
+            logger.debug("Closing the browser.")
+            try:
+                await self.browser.close()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning("Error closing the browser: %s", e)
+            self.browser = None
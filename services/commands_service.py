@@ -0,0 +1,174 @@
+"""
+Module that contains the discord slash commands.
+"""
+
+import discord
+from discord import app_commands
+
+from common.constants import QUERY_HISTORY_SIZE
+from logger.logger import logger
+from services.query_service import ListingQueries
+
+# Embeds have at most 25 fields.
+MAX_EMBED_FIELDS = 25
+
+
+def register_commands(tree: app_commands.CommandTree, queries: ListingQueries):
+    """
+    Adds the /search, /price-history and /stats commands to the command tree.
+    The commands answer from the saved listings, the website is not loaded.
+    :param tree: app_commands.CommandTree
+    :param queries: ListingQueries
+    :return:
+    """
+
+    @tree.command(name="search", description="Search the saved listings.")
+    @app_commands.describe(
+        region="Market shown by /stats, e.g. oglasi-oddaja/ljubljana-mesto/stanovanje",
+        min_price="Lowest price in €",
+        max_price="Highest price in €",
+        page="Page of the results",
+    )
+    async def search(
+        interaction: discord.Interaction,
+        region: str | None = None,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        page: app_commands.Range[int, 1, 1000] = 1,
+    ):
+        listings, more_pages = await queries.search(
+            region=region, min_price=min_price, max_price=max_price, page=page
+        )
+        await interaction.response.send_message(
+            embed=build_search_embed(listings, page=page, more_pages=more_pages)
+        )
+
+    @tree.command(
+        name="price-history", description="Show the price history of a listing."
+    )
+    @app_commands.describe(listing_id="Id of the listing shown by /search")
+    async def price_history(interaction: discord.Interaction, listing_id: str):
+        history = await queries.price_history(listing_id)
+        details = await queries.details(listing_id)
+        await interaction.response.send_message(
+            embed=build_history_embed(listing_id, history, details)
+        )
+
+    @tree.command(name="stats", description="Show price statistics by market.")
+    @app_commands.describe(region="Market of the search url, all markets if empty")
+    async def stats(interaction: discord.Interaction, region: str | None = None):
+        await interaction.response.send_message(
+            embed=build_stats_embed(await queries.stats(region))
+        )
+
+    @tree.error
+    async def on_error(
+        interaction: discord.Interaction, error: app_commands.AppCommandError
+    ):
+        logger.warning("Command %s failed: %s", interaction.command, error)
+        if not interaction.response.is_done():
+            await interaction.response.send_message(
+                "The command failed, please try again later.", ephemeral=True
+            )
+
+    logger.debug("Registered %d slash commands.", len(tree.get_commands()))
+
+
+def build_search_embed(
+    listings: list[tuple[str, str, float, str | None]], page: int, more_pages: bool
+) -> discord.Embed:
+    """
+    Builds the embed of a /search answer page.
+    :param listings: list of (nepremicnine id, url, last price, region)
+    :param page: int
+    :param more_pages: bool
+    :return: discord.Embed
+    """
+    embed = discord.Embed(title="Saved listings", color=discord.Color.blue())
+
+    if listings:
+        embed.description = "\n".join(
+            f"[{nepremicnine_id}]({url}) **{price:.2f} €**"
+            + (f" ({region})" if region else "")
+            for nepremicnine_id, url, price, region in listings
+        )
+    else:
+        embed.description = "No listings found."
+
+    embed.set_footer(
+        text=f"Page {page}" + (f", use page {page + 1} for more." if more_pages else "")
+    )
+
+    return embed
+
+
+def build_history_embed(
+    listing_id: str, history: tuple | None, details: dict | None = None
+) -> discord.Embed:
+    """
+    Builds the embed of a /price-history answer.
+    :param listing_id: str
+    :param history: (url, list of (accessed time, price)), None if the listing is not saved
+    :param details: details loaded from the listing page
+    :return: discord.Embed
+    """
+    if history is None:
+        return discord.Embed(
+            title=f"Listing {listing_id}",
+            description="Listing is not saved.",
+            color=discord.Color.blue(),
+        )
+
+    url, prices = history
+    lines = [
+        f"{accessed_time:%d.%m.%Y}: **{price:.2f} €**"
+        for accessed_time, price in prices[-QUERY_HISTORY_SIZE:]
+    ]
+    if len(prices) > QUERY_HISTORY_SIZE:
+        lines.insert(0, f"... {len(prices) - QUERY_HISTORY_SIZE} older prices")
+
+    embed = discord.Embed(
+        title=f"Listing {listing_id}",
+        url=url,
+        description="\n".join(lines) or "No prices saved.",
+        color=discord.Color.blue(),
+    )
+
+    for name, key in (
+        ("Address", "address"),
+        ("Agency", "agency"),
+        ("Energy class", "energy_class"),
+    ):
+        if details and details.get(key):
+            embed.add_field(name=name, value=details[key], inline=True)
+    if details and details.get("photos"):
+        embed.set_image(url=details["photos"][0])
+
+    return embed
+
+
+def build_stats_embed(
+    stats: list[tuple[str | None, int, float, float, float]],
+) -> discord.Embed:
+    """
+    Builds the embed of a /stats answer.
+    :param stats: list of (region, count, min price, average price, max price)
+    :return: discord.Embed
+    """
+    embed = discord.Embed(title="Listing statistics", color=discord.Color.blue())
+
+    if not stats:
+        embed.description = "No listings found."
+
+    for region, count, min_price, avg_price, max_price in stats[:MAX_EMBED_FIELDS]:
+        embed.add_field(
+            name=region or "Unknown market",
+            value=(
+                f"{count} listings\n"
+                f"{min_price:.2f} € - {max_price:.2f} €\n"
+                f"Average {avg_price:.2f} €"
+            ),
+            inline=True,
+        )
+
+    return embed
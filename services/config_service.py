@@ -0,0 +1,324 @@
+"""
+Module that contains search config logic.
+"""
+
+import asyncio
+import os
+from urllib.parse import urlsplit
+
+from common.constants import CONFIG_PATH
+from common.listing import ListingRecord
+from logger.logger import logger
+from spider.planner import in_range, plan_searches, Search
+
+
+class ConfigError(ValueError):
+    """
+    Raised when the config file is not valid.
+    """
+
+
+class ConfigEntry:  # pylint: disable=too-few-public-methods
+    """
+    Single line of the config file.
+    A line contains a discord channel id, a nepremicnine.net search url and
+    optional `key=value` options:
+    - interval: minutes between scans of the search, disables adaptive scheduling,
+    - concurrency: number of result pages of the search loaded in parallel,
+    - incremental: true stops pagination at the first page with only known
+      listings, only for searches sorted from the newest listing,
+    - min_price, max_price, min_size, max_size: filters of the sent listings,
+    - min_drop: price changes are sent only if the price dropped by at least
+      this percent,
+    - below_market: listings are sent only if their price per m² is at least
+      this percent below the median of their region.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        channel_id: str,
+        url: str,
+        *,
+        interval: float | None = None,
+        concurrency: int | None = None,
+        incremental: bool | None = None,
+        filters: dict[str, tuple] | None = None,
+        alerts: dict[str, float] | None = None,
+    ):
+        self.channel_id = channel_id
+        self.url = url
+        self.interval = interval
+        self.concurrency = concurrency
+        # Early stop of the pagination, None for the spider default.
+        self.incremental = incremental
+        # Price and size ranges as (low, high), None is unbounded.
+        self.filters = filters or {}
+        # Alert rule thresholds in percent by rule name.
+        self.alerts = alerts or {}
+
+    def matches(self, price: float, size: float) -> bool:
+        """
+        Returns True if the listing passes the filters of the entry.
+        :param price: float
+        :param size: float
+        :return: bool
+        """
+        return in_range(price, self.filters.get("price", (None, None))) and in_range(
+            size, self.filters.get("size", (None, None))
+        )
+
+    def alerts_match(self, listing: ListingRecord) -> bool:
+        """
+        Returns True if the analyzed listing passes the alert rules of the entry.
+        :param listing: listing with the attached price history and analytics
+        :return: bool
+        """
+        analytics = listing.analytics or {}
+
+        min_drop = self.alerts.get("min_drop")
+        if (
+            min_drop is not None
+            and len(listing.prices) > 1
+            and (analytics.get("drop") is None or analytics["drop"] < min_drop)
+        ):
+            return False
+
+        below_market = self.alerts.get("below_market")
+        if below_market is not None and (
+            analytics.get("below_market") is None
+            or analytics["below_market"] < below_market
+        ):
+            return False
+
+        return True
+
+
+class RoutingTable:
+    """
+    Compiled config.
+    Holds the config entries, the planned searches and the searches every
+    entry is crawled through, so a scan does not parse anything.
+    A table is never changed after it is built.
+    """
+
+    def __init__(self, entries: list[ConfigEntry]):
+        self.entries = entries
+        # Url to crawl for every configured url.
+        self.plan = plan_searches([entry.url for entry in entries])
+        self.crawl_urls = list(dict.fromkeys(self.plan.values()))
+        # Searches of the urls crawled through a wider search.
+        self.searches = {
+            url: Search(url) for url, crawl_url in self.plan.items() if url != crawl_url
+        }
+        # Region saved with the listings found by every crawled search.
+        self.regions = {
+            crawl_url: Search(crawl_url).region for crawl_url in self.crawl_urls
+        }
+
+    def routes(self, crawl_urls: list[str] | None = None) -> list[ConfigEntry]:
+        """
+        Returns the entries crawled through the given urls, all entries if None.
+        :param crawl_urls: list[str] | None
+        :return: list[ConfigEntry]
+        """
+        if crawl_urls is None:
+            return self.entries
+        return [entry for entry in self.entries if self.plan[entry.url] in crawl_urls]
+
+    def interval(self, crawl_url: str) -> float | None:
+        """
+        Returns the shortest fixed interval of the entries crawled through the url.
+        :param crawl_url: str
+        :return: minutes, None for an adaptive interval
+        """
+        intervals = [
+            entry.interval
+            for entry in self.routes([crawl_url])
+            if entry.interval is not None
+        ]
+        return min(intervals) if intervals else None
+
+    def concurrency(self, crawl_url: str) -> int | None:
+        """
+        Returns the highest concurrency of the entries crawled through the url.
+        :param crawl_url: str
+        :return: int, None for the default
+        """
+        concurrencies = [
+            entry.concurrency
+            for entry in self.routes([crawl_url])
+            if entry.concurrency is not None
+        ]
+        return max(concurrencies) if concurrencies else None
+
+    def incremental(self, crawl_url: str, default: bool) -> bool:
+        """
+        Returns True if all entries crawled through the url allow the early
+        stop of the pagination.
+        :param crawl_url: str
+        :param default: value for the entries without the option
+        :return: bool
+        """
+        return all(
+            default if entry.incremental is None else entry.incremental
+            for entry in self.routes([crawl_url])
+        )
+
+    def matches(self, entry: ConfigEntry, price: float, size: float) -> bool:
+        """
+        Returns True if a listing of the crawled search belongs to the entry.
+        :param entry: ConfigEntry
+        :param price: float
+        :param size: float
+        :return: bool
+        """
+        search = self.searches.get(entry.url)
+        return (search is None or search.matches(price=price, size=size)) and (
+            entry.matches(price=price, size=size)
+        )
+
+
+def parse_config(text: str) -> list[ConfigEntry]:
+    """
+    Parses and validates the config file content.
+    Empty lines and lines starting with # are skipped.
+    Raises ConfigError with the line number if a line is not valid.
+    :param text: str
+    :return: list[ConfigEntry]
+    """
+    entries = []
+
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        try:
+            entries.append(parse_line(line))
+        except ValueError as e:
+            raise ConfigError(f"Line {number} of the config is not valid: {e}") from e
+
+    if not entries:
+        raise ConfigError("Config does not contain any searches.")
+
+    return entries
+
+
+def parse_line(line: str) -> ConfigEntry:
+    """
+    Parses a single config line.
+    Raises ValueError if the line is not valid.
+    :param line: str
+    :return: ConfigEntry
+    """
+    parts = line.split()
+    if len(parts) < 2:
+        raise ValueError("expected a channel id and a search url")
+
+    channel_id, url, *options = parts
+
+    if not channel_id.isdigit():
+        raise ValueError(f"channel id {channel_id} is not a number")
+
+    parsed_url = urlsplit(url)
+    if parsed_url.scheme not in ("http", "https") or not parsed_url.netloc:
+        raise ValueError(f"{url} is not a http url")
+
+    entry = ConfigEntry(channel_id=channel_id, url=url)
+
+    for option in options:
+        key, separator, value = option.partition("=")
+        if not separator or not value:
+            raise ValueError(f"option {option} is not in key=value format")
+        set_option(entry, key, value)
+
+    return entry
+
+
+def set_option(entry: ConfigEntry, key: str, value: str):
+    """
+    Validates an option value and sets it on the entry.
+    Raises ValueError if the option is not valid.
+    :param entry: ConfigEntry
+    :param key: str
+    :param value: str
+    :return:
+    """
+    if key == "incremental":
+        if value not in ("true", "false"):
+            raise ValueError(f"option {key} must be true or false")
+        entry.incremental = value == "true"
+        return
+
+    if key == "concurrency":
+        entry.concurrency = int(value)
+        number = entry.concurrency
+    else:
+        number = float(value)
+
+    if number <= 0:
+        raise ValueError(f"option {key} must be positive")
+
+    if key == "interval":
+        entry.interval = number
+    elif key in ("min_price", "max_price", "min_size", "max_size"):
+        bound, name = key.split("_")
+        low, high = entry.filters.get(name, (None, None))
+        entry.filters[name] = (number, high) if bound == "min" else (low, number)
+    elif key in ("min_drop", "below_market"):
+        entry.alerts[key] = number
+    elif key != "concurrency":
+        raise ValueError(f"unknown option {key}")
+
+
+def load_config(path: str = CONFIG_PATH) -> RoutingTable:
+    """
+    Reads, validates and compiles the config file.
+    Raises ConfigError if the config is not valid and OSError if it can not be read.
+    :param path: str
+    :return: RoutingTable
+    """
+    with open(path, encoding="utf-8") as file:
+        return RoutingTable(parse_config(file.read()))
+
+
+class ConfigWatcher:  # pylint: disable=too-few-public-methods
+    """
+    Keeps the compiled config up to date with the config file.
+    The file is reloaded when its modification time changes. A new table
+    replaces the current one in a single assignment, so a running scan
+    keeps the table it started with. If the changed file is not valid the
+    current table is kept.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self.table: RoutingTable | None = None
+        self.mtime: float | None = None
+
+    async def refresh(self) -> RoutingTable | None:
+        """
+        Reloads the config if the file changed.
+        :return: the current table, None if no valid config was loaded yet
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logger.error("Error reading the config: %s", e)
+            return self.table
+
+        if mtime == self.mtime:
+            return self.table
+
+        self.mtime = mtime
+
+        try:
+            table = await asyncio.to_thread(load_config, self.path)
+        except (ConfigError, OSError) as e:
+            logger.error("Keeping the previous config, %s", e)
+            return self.table
+
+        logger.info("Loaded config with %d searches.", len(table.entries))
+        self.table = table
+
+        return self.table
@@ -0,0 +1,250 @@
+"""
+Module that contains repost detection logic.
+The title and description of a listing are reduced to a MinHash signature
+of their character shingles. Signatures are split into LSH bands and the
+saved listings are indexed by the hash of every band, so the candidates of
+a repost are the listings sharing a band bucket and the whole history is
+never compared.
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import unicodedata
+from array import array
+
+from common.constants import (
+    DEDUP_BANDS,
+    DEDUP_MIN_SIMILARITY,
+    DEDUP_NUM_PERM,
+    DEDUP_PRICE_TOLERANCE,
+    DEDUP_SHINGLE_SIZE,
+    DEDUP_SIZE_TOLERANCE,
+)
+from common.listing import ListingRecord
+from database.database_manager import DatabaseManager
+from logger.logger import logger
+
+# Modulus of the permutation hashes, values fit the signed 64-bit SQLite integer.
+MERSENNE_PRIME = (1 << 61) - 1
+
+# Coefficients of the permutation hashes. The seed is fixed, so signatures
+# of different runs are comparable.
+_generator = random.Random(DEDUP_NUM_PERM)
+PERMUTATIONS = [
+    (_generator.randrange(1, MERSENNE_PRIME), _generator.randrange(MERSENNE_PRIME))
+    for _ in range(DEDUP_NUM_PERM)
+]
+
+# Band of the image url bucket, after the signature bands.
+IMAGE_BAND = DEDUP_BANDS
+
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Lowercases the text and removes accents, punctuation and repeated spaces.
+    :param text: str
+    :return: str
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return NON_WORD_PATTERN.sub(" ", text).strip()
+
+
+def stable_hash(value: bytes) -> int:
+    """
+    Returns a signed 64-bit hash that is the same in every run.
+    :param value: bytes
+    :return: int
+    """
+    return int.from_bytes(
+        hashlib.blake2b(value, digest_size=8).digest(), "big", signed=True
+    )
+
+
+def minhash(listing: ListingRecord) -> array | None:
+    """
+    Returns the MinHash signature of the title and description of the listing.
+    :param listing: ListingRecord
+    :return: array of DEDUP_NUM_PERM values, None if the listing has no text
+    """
+    text = normalize_text(f"{listing.title or ''} {listing.description or ''}")
+    if not text:
+        return None
+
+    shingles = {
+        stable_hash(text[start : start + DEDUP_SHINGLE_SIZE].encode())
+        for start in range(max(len(text) - DEDUP_SHINGLE_SIZE + 1, 1))
+    }
+
+    return array(
+        "q",
+        (
+            min((a * shingle + b) % MERSENNE_PRIME for shingle in shingles)
+            for a, b in PERMUTATIONS
+        ),
+    )
+
+
+def band_keys(signature: array, image_url: str | None) -> list[tuple[int, int]]:
+    """
+    Returns the LSH band buckets of the signature and the image url.
+    :param signature: array
+    :param image_url: str | None
+    :return: list of (band, bucket)
+    """
+    rows = DEDUP_NUM_PERM // DEDUP_BANDS
+    keys = [
+        (band, stable_hash(signature[band * rows : (band + 1) * rows].tobytes()))
+        for band in range(DEDUP_BANDS)
+    ]
+    if image_url:
+        keys.append((IMAGE_BAND, stable_hash(image_url.encode())))
+    return keys
+
+
+def similarity(first: array, second: array) -> float:
+    """
+    Estimates the Jaccard similarity of the shingles of two signatures.
+    :param first: array
+    :param second: array
+    :return: float between 0 and 1
+    """
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+def close(first: float | None, second: float | None, tolerance: float) -> bool:
+    """
+    Returns True if the values differ by at most the tolerance relative to
+    the larger value. Missing values are only close to missing values.
+    :param first: float | None
+    :param second: float | None
+    :param tolerance: float
+    :return: bool
+    """
+    if not first or not second:
+        return not first and not second
+    return abs(first - second) <= tolerance * max(first, second)
+
+
+def signatures_of(
+    listings: dict[str, ListingRecord],
+) -> dict[str, tuple[array, list[tuple[int, int]]]]:
+    """
+    Computes the signature and the band keys of every listing with text.
+    :param listings: listings by nepremicnine id
+    :return: (signature, band keys) by nepremicnine id
+    """
+    signatures = {}
+
+    for nepremicnine_id, listing in listings.items():
+        signature = minhash(listing)
+        if signature is not None:
+            signatures[nepremicnine_id] = (
+                signature,
+                band_keys(signature, listing.image_url),
+            )
+
+    return signatures
+
+
+async def find_reposts(
+    database_manager: DatabaseManager, listings: dict[str, ListingRecord]
+) -> tuple[dict[str, tuple[bytes, list[tuple[int, int]]]], dict[str, int]]:
+    """
+    Finds the new listings that are reposts of saved listings.
+    Candidates share a band bucket with the listing. A candidate is a repost
+    if its size and price are close and its text is similar, a shared image
+    halves the required text similarity. The most similar candidate is taken
+    and reposts of reposts are linked to the first listing.
+    Only the saved listings are compared, reposts within the same scan are
+    found by the next scan.
+    :param database_manager: DatabaseManager
+    :param listings: new listings by nepremicnine id
+    :return: (signature bytes, band keys) by nepremicnine id and
+        original listing id by nepremicnine id of a repost
+    """
+    if not listings:
+        return {}, {}
+
+    signatures = await asyncio.to_thread(signatures_of, listings)
+
+    buckets = await database_manager.get_band_candidates(
+        key for _, keys in signatures.values() for key in keys
+    )
+    candidates = await database_manager.get_repost_candidates(
+        {listing_id for listing_ids in buckets.values() for listing_id in listing_ids}
+    )
+
+    reposts = {}
+
+    for nepremicnine_id, (signature, keys) in signatures.items():
+        match = best_match(
+            listing=listings[nepremicnine_id],
+            signature=signature,
+            keys=keys,
+            buckets=buckets,
+            candidates=candidates,
+        )
+        if match is not None:
+            score, original_id = match
+            reposts[nepremicnine_id] = original_id
+            logger.info(
+                "Listing %s is a repost of listing %d (similarity %.2f).",
+                nepremicnine_id,
+                original_id,
+                score,
+            )
+
+    return {
+        nepremicnine_id: (signature.tobytes(), keys)
+        for nepremicnine_id, (signature, keys) in signatures.items()
+    }, reposts
+
+
+def best_match(
+    listing: ListingRecord,
+    signature: array,
+    keys: list[tuple[int, int]],
+    buckets: dict[tuple[int, int], list[int]],
+    candidates: dict[int, tuple[bytes, float | None, float, str | None, int | None]],
+) -> tuple[float, int] | None:
+    """
+    Returns the most similar candidate that is a repost of the listing.
+    :param listing: ListingRecord
+    :param signature: signature of the listing
+    :param keys: band keys of the listing
+    :param buckets: saved listing ids by band key
+    :param candidates: saved fields by listing id, see get_repost_candidates
+    :return: (similarity, original listing id), None if not a repost
+    """
+    image_key = keys[-1] if keys[-1][0] == IMAGE_BAND else None
+
+    best = None
+    best_score = 0.0
+
+    for listing_id in {
+        listing_id for key in keys for listing_id in buckets.get(key, ())
+    }:
+        if listing_id not in candidates:
+            continue
+        saved_signature, size, last_price, _, original_id = candidates[listing_id]
+
+        if not close(listing.size, size, DEDUP_SIZE_TOLERANCE) or not close(
+            listing.price, last_price, DEDUP_PRICE_TOLERANCE
+        ):
+            continue
+
+        score = similarity(signature, array("q", saved_signature))
+        shared_image = listing_id in buckets.get(image_key, ())
+        if score < DEDUP_MIN_SIMILARITY / (2 if shared_image else 1):
+            continue
+
+        if score > best_score:
+            best_score = score
+            best = (score, original_id or listing_id)
+
+    return best
@@ -0,0 +1,275 @@
+"""
+Module that contains discord message delivery logic.
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+import aiohttp
+import discord
+
+from common.constants import (
+    DELIVERY_MAX_EMBED_CHARACTERS,
+    DELIVERY_MAX_EMBEDS,
+    DELIVERY_MAX_RETRIES,
+    DELIVERY_RETRY_DELAY,
+)
+from common.listing import ListingRecord
+from logger.logger import logger
+from services.metrics_service import (
+    DELIVERY_FAILURES_TOTAL,
+    DELIVERY_MESSAGES_TOTAL,
+    DELIVERY_SEND_SECONDS,
+)
+
+
+class DeliveryQueue:
+    """
+    Delivers messages to discord channels in the background.
+    Every channel has its own queue and worker, so channels are sent to
+    concurrently while messages of a channel keep their order. Queued embeds
+    are packed into messages of up to 10 embeds. Discord rate limits are
+    handled by the discord.py HTTP client, which waits for the rate limit
+    buckets reported in the response headers; transient failures are retried
+    with an exponential backoff.
+    After every message `on_sent` is called with the tokens of the sent
+    messages and a boolean if the delivery succeeded.
+    """
+
+    def __init__(
+        self,
+        client: discord.Client,
+        on_sent: Callable[[list, bool], Awaitable[None]] | None = None,
+        max_retries: int = DELIVERY_MAX_RETRIES,
+        retry_delay: float = DELIVERY_RETRY_DELAY,
+    ):
+        self.client = client
+        self.on_sent = on_sent
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.queues: dict[int, asyncio.Queue] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+
+    def submit(
+        self,
+        channel_id: int,
+        content: str | None = None,
+        embed: discord.Embed | None = None,
+        token=None,
+    ):
+        """
+        Queues a text message or an embed for the channel.
+        :param channel_id: int
+        :param content: message text
+        :param embed: message embed
+        :param token: value passed to on_sent after the message is sent
+        :return:
+        """
+        if channel_id not in self.queues:
+            self.queues[channel_id] = asyncio.Queue()
+            self.workers[channel_id] = asyncio.create_task(
+                self.deliver(channel_id), name=f"delivery-{channel_id}"
+            )
+        self.queues[channel_id].put_nowait((content, embed, token))
+
+    async def join(self):
+        """
+        Waits until all queued messages are delivered.
+        :return:
+        """
+        await asyncio.gather(*(queue.join() for queue in self.queues.values()))
+
+    async def close(self):
+        """
+        Stops all the workers.
+        :return:
+        """
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        self.workers.clear()
+        self.queues.clear()
+
+    async def deliver(self, channel_id: int):
+        """
+        Worker that sends the queued messages of a channel.
+        :param channel_id: int
+        :return:
+        """
+        queue = self.queues[channel_id]
+
+        # Message that did not fit into the previous batch.
+        carry = None
+
+        while True:
+            batch = [carry if carry is not None else await queue.get()]
+            carry = None
+
+            # Pack the embeds that are already waiting into the same message.
+            # A text message always starts a new message.
+            embeds = 1 if batch[0][1] else 0
+            characters = len(batch[0][1]) if batch[0][1] else 0
+            while not queue.empty() and embeds < DELIVERY_MAX_EMBEDS:
+                item = queue.get_nowait()
+                content, embed, _ = item
+                if (
+                    content is not None
+                    or characters + len(embed) > DELIVERY_MAX_EMBED_CHARACTERS
+                ):
+                    carry = item
+                    break
+                batch.append(item)
+                embeds += 1
+                characters += len(embed)
+
+            delivered = False
+            try:
+                await self.send(channel_id=channel_id, batch=batch)
+                delivered = True
+            except Exception as e:  # pylint: disable=broad-except
+                DELIVERY_FAILURES_TOTAL.inc()
+                logger.error(
+                    "Dropping %d messages for channel %s: %s", len(batch), channel_id, e
+                )
+
+            try:
+                tokens = [token for _, _, token in batch if token is not None]
+                if self.on_sent is not None and tokens:
+                    await self.on_sent(tokens, delivered)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Error handling sent messages: %s", e)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def send(self, channel_id: int, batch: list):
+        """
+        Sends a batch as a single message, retrying transient failures.
+        :param channel_id: int
+        :param batch: list of (content, embed, token)
+        :return:
+        """
+        content = batch[0][0]
+        embeds = [embed for _, embed, _ in batch if embed is not None]
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                channel = self.client.get_channel(
+                    channel_id
+                ) or await self.client.fetch_channel(channel_id)
+                with DELIVERY_SEND_SECONDS.time():
+                    await channel.send(content=content, embeds=embeds)
+                DELIVERY_MESSAGES_TOTAL.inc()
+                logger.debug(
+                    "Sent message with %d embeds to channel %s.",
+                    len(embeds),
+                    channel_id,
+                )
+                return
+            except (
+                discord.DiscordServerError,
+                discord.RateLimited,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                logger.warning(
+                    "Sending to channel %s failed, retrying in %.0f s: %s",
+                    channel_id,
+                    delay,
+                    e,
+                )
+                await asyncio.sleep(delay)
+
+
+def build_embed(listing: ListingRecord) -> discord.Embed:
+    """
+    Builds the discord embed of a listing.
+    :param listing: listing with the attached price history
+    :return: discord.Embed
+    """
+    prices = listing.prices if listing.prices is not None else [listing.price]
+
+    embed = discord.Embed(
+        title=listing.title,
+        url=listing.url,
+        description=listing.description,
+        color=discord.Color.blue(),
+    )
+    if listing.image_url:
+        embed.set_image(url=listing.image_url)
+    embed.add_field(
+        name="**Cena**",
+        value=f"{prices[-1]:.2f} €",
+        inline=True,
+    )
+    embed.add_field(
+        name="**Velikost**",
+        value=f"{listing.size:.2f} m²",
+        inline=True,
+    )
+    if listing.year:
+        embed.add_field(
+            name="**Zgrajeno leta**",
+            value=listing.year,
+            inline=True,
+        )
+    if listing.floor:
+        embed.add_field(
+            name="**Nadstropje**",
+            value=listing.floor,
+            inline=True,
+        )
+
+    if len(prices) > 1:
+        embed.add_field(
+            name="**Prejšnje cene**",
+            value=", ".join(f"{price:.2f} €" for price in prices[:-1]),
+            inline=False,
+        )
+
+    add_analytics_fields(embed, listing.analytics or {})
+
+    return embed
+
+
+def add_analytics_fields(embed: discord.Embed, analytics: dict):
+    """
+    Adds the price analytics of a listing to its embed.
+    :param embed: discord.Embed
+    :param analytics: analytics of the listing, see services.analytics_service
+    :return:
+    """
+    if analytics.get("price_per_m2") is not None:
+        embed.add_field(
+            name="**Cena na m²**",
+            value=f"{analytics['price_per_m2']:.2f} €/m²",
+            inline=True,
+        )
+    if analytics.get("drop") is not None and analytics["drop"] > 0:
+        embed.add_field(
+            name="**Znižanje**",
+            value=f"{analytics['drop']:.1f} % (skupaj {analytics['total_drop']:.1f} %)",
+            inline=True,
+        )
+    if analytics.get("below_market") is not None:
+        difference = analytics["below_market"]
+        embed.add_field(
+            name="**Glede na mediano m²**",
+            value=f"{abs(difference):.1f} % {'pod' if difference >= 0 else 'nad'}",
+            inline=True,
+        )
+    if analytics.get("market_p25") is not None:
+        embed.add_field(
+            name="**Običajna cena na m²**",
+            value=f"{analytics['market_p25']:.0f} - {analytics['market_p75']:.0f} €/m²",
+            inline=True,
+        )
+    if analytics.get("days_on_market"):
+        embed.add_field(
+            name="**Na trgu**",
+            value=f"{analytics['days_on_market']:.0f} dni",
+            inline=True,
+        )
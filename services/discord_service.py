@@ -5,24 +5,102 @@ Module that contains discord bot logic.
 
 
 import discord
+from discord import app_commands
 from discord.ext import tasks
+from common.constants import SCHEDULER_TICK
 from logger.logger import logger
 from database.database_manager import DatabaseManager
+from services.browser_service import BrowserManager
+from services.commands_service import register_commands
+from services.config_service import ConfigWatcher
+from services.enrichment_service import EnrichmentWorker
+from services.metrics_service import MetricsServer, registry
+from services.outbox_service import OutboxConsumer
+from services.query_service import ListingQueries
+from services.scheduler_service import SearchScheduler
 from spider.spider import run_spider
 
 
-class MyDiscordClient(discord.Client):
+class MyDiscordClient(discord.Client):  # pylint: disable=too-many-instance-attributes
     """
     Nepremicnine.si Discord bot client.
     """
 
-    def __init__(self, database_path):
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        database_path,
+        *,
+        spider_options: dict | None = None,
+        browser_options: dict | None = None,
+        scheduler_options: dict | None = None,
+        metrics_options: dict | None = None,
+        enrichment_options: dict | None = None,
+    ):
         self.database_path = database_path
+        # Database manager is shared by all scans and disposed on shutdown.
+        self.database_manager = DatabaseManager(
+            url="sqlite+aiosqlite:///" + database_path
+        )
+        self.spider_options = spider_options or {}
+        # Config is reloaded when the config file changes.
+        self.config_watcher = ConfigWatcher()
+        # Every search is scanned on its own adaptive interval.
+        self.scheduler = SearchScheduler(**(scheduler_options or {}))
+        # Metrics are served only if a port is configured.
+        metrics_options = metrics_options or {}
+        self.metrics_server = (
+            MetricsServer(metrics_registry=registry, **metrics_options)
+            if metrics_options.get("port")
+            else None
+        )
+        # Listing pages are loaded after the scans only if enabled.
+        enrichment_options = enrichment_options or {}
+        self.enrichment = (
+            EnrichmentWorker(
+                database_manager=self.database_manager,
+                concurrency=enrichment_options["concurrency"],
+                budget=enrichment_options["budget"],
+                host_delay=self.spider_options.get("host_delay", 0.0),
+            )
+            if enrichment_options.get("enabled")
+            else None
+        )
+        # Browser is kept alive between scans.
+        self.browser_manager = BrowserManager(**(browser_options or {}))
         super().__init__(intents=discord.Intents.default())
+        # Notifications are delivered from the outbox in the background.
+        self.outbox = OutboxConsumer(
+            database_manager=self.database_manager, client=self
+        )
+        # Slash commands answer from the saved data through a cache.
+        self.queries = ListingQueries(database_manager=self.database_manager)
+        self.tree = app_commands.CommandTree(self)
 
     async def setup_hook(self) -> None:
         # start the task to run in the background
         self.my_background_task.start()
+        # Deliver notifications left over from a previous run.
+        self.outbox.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        register_commands(self.tree, self.queries)
+        try:
+            await self.tree.sync()
+        except discord.HTTPException as e:
+            logger.warning("Error syncing slash commands: %s", e)
+
+    async def close(self) -> None:
+        """
+        Closes the metrics server, the outbox, the browser, the database
+        and the discord client.
+        :return:
+        """
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        await self.outbox.close()
+        await self.browser_manager.close()
+        await self.database_manager.cleanup()
+        await super().close()
 
     async def on_ready(self):
         """
@@ -32,88 +110,79 @@ class MyDiscordClient(discord.Client):
         logger.debug("""Logged in as %s (ID: %s)""", self.user, self.user.id)
         logger.debug("------")
 
-    @tasks.loop(hours=1)  # task runs every 1 hour
+    @tasks.loop(seconds=SCHEDULER_TICK)  # task checks for due searches every minute
     async def my_background_task(self):
         """
-        Background task that runs every day.
+        Background task that scans the searches that are due.
+        Searches are scheduled again even if the scan fails, so a failing
+        scan is retried after the interval of the search.
         :return:
         """
+        due_urls = []
+        new_counts = {}
 
-        logger.info("Scan started.")
+        try:
+            # The table is not changed by a reload during the scan.
+            routing_table = await self.config_watcher.refresh()
+            if routing_table is None:
+                return
+
+            due_urls = self.scheduler.due(
+                routing_table.crawl_urls,
+                fixed_intervals={
+                    crawl_url: routing_table.interval(crawl_url)
+                    for crawl_url in routing_table.crawl_urls
+                },
+            )
+            if not due_urls:
+                return
 
-        # Setup database manager.
-        database_manager = DatabaseManager(
-            url="sqlite+aiosqlite:///" + self.database_path
-        )
+            logger.info("Scan of %d searches started.", len(due_urls))
+
+            # Periodically crawl all pages, so price changes on deep pages are caught.
+            full_sweep_urls = {
+                page_url for page_url in due_urls if self.scheduler.full_sweep(page_url)
+            }
 
-        try:
             # Run the spider.
-            channel_listings, error = await run_spider(
-                database_manager=database_manager
+            channel_listings, error, new_counts = await run_spider(
+                database_manager=self.database_manager,
+                browser_manager=self.browser_manager,
+                routing_table=routing_table,
+                crawl_urls=due_urls,
+                full_sweep_urls=full_sweep_urls,
+                enrichment=self.enrichment,
+                **self.spider_options,
             )
 
+            for page_url in due_urls:
+                self.scheduler.record(page_url, new_counts.get(page_url))
+
             for channel_id, listings in channel_listings.items():
-                logger.debug("Sending listings to channel %s.", channel_id)
-
-                channel = self.get_channel(int(channel_id))  # channel ID goes here
-
-                logger.debug("Found %s new listings.", len(listings))
-
-                await channel.send(f"Found {len(listings)} new listings.")
-
-                for listing in listings:
-                    title, image_url, description, prices, size, year, floor, url = (
-                        listing
-                    )
-
-                    logger.debug("Listing: %s", listing)
-
-                    embed = discord.Embed(
-                        title=title,
-                        url=url,
-                        description=description,
-                        color=discord.Color.blue(),
-                    )
-                    if image_url:
-                        embed.set_image(url=image_url)
-                    embed.add_field(
-                        name="**Cena**",
-                        value=f"{prices[-1]:.2f} €",
-                        inline=True,
-                    )
-                    embed.add_field(
-                        name="**Velikost**",
-                        value=f"{size:.2f} m²",
-                        inline=True,
-                    )
-                    if year:
-                        embed.add_field(
-                            name="**Zgrajeno leta**",
-                            value=year,
-                            inline=True,
-                        )
-                    if floor:
-                        embed.add_field(
-                            name="**Nadstropje**",
-                            value=floor,
-                            inline=True,
-                        )
-
-                    if len(prices) > 1:
-                        embed.add_field(
-                            name="**Prejšnje cene**",
-                            value=", ".join(f"{price:.2f} €" for price in prices[:-1]),
-                            inline=False,
-                        )
-
-                    await channel.send(embed=embed)
-
-                if error:
-                    await channel.send("An error occurred while scanning the website.")
+                logger.debug(
+                    "Found %s new listings for channel %s.", len(listings), channel_id
+                )
+
+            if error:
+                logger.warning("An error occurred while scanning the website.")
+
+            # Notifications were saved with the scan, deliver them now.
+            self.outbox.wake()
+
+            if self.enrichment is not None:
+                await self.enrichment.run()
+
+            # Cached command answers do not contain the scanned data.
+            self.queries.invalidate()
 
             logger.info("Scan finished.")
+            logger.debug("Database stats: %s", self.database_manager.stats())
         except Exception as e:  # pylint: disable=broad-except
             logger.warning("Spider crashed with error: %s", e)
+            # Searches of a crashed scan are retried after their interval.
+            for page_url in due_urls:
+                if page_url not in new_counts:
+                    self.scheduler.record(page_url, None)
 
     @my_background_task.before_loop
     async def before_my_task(self):
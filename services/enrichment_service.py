@@ -0,0 +1,149 @@
+"""
+Module that contains listing detail enrichment logic.
+"""
+
+import asyncio
+
+from common.constants import (
+    DEFAULT_ENRICHMENT_BUDGET,
+    DEFAULT_ENRICHMENT_CONCURRENCY,
+    HTTP_MAX_FAILURES,
+)
+from common.listing import ListingRecord
+from database.database_manager import DatabaseManager
+from logger.logger import logger
+from services.extract_service import parse_detail_html
+from services.http_service import HttpFetcher
+from services.metrics_service import ENRICHMENT_PAGES_TOTAL, ENRICHMENT_PENDING
+from util.util import HostThrottle
+
+
+class EnrichmentWorker:
+    """
+    Loads the listing pages of new and changed listings for the details
+    that are not shown on the result page.
+    Listings are queued by the spider. After a scan at most `budget` listing
+    pages are loaded by a pool of `concurrency` workers, the rest stays
+    queued for the next scan. Details are cached by the nepremicnine id and
+    the content hash, so a listing page is loaded again only when the
+    listing content changes.
+    After HTTP_MAX_FAILURES failed pages in a row the batch is stopped and
+    its remaining listings stay queued, so an unavailable site does not
+    use up the budget of every scan.
+    """
+
+    def __init__(
+        self,
+        database_manager: DatabaseManager,
+        concurrency: int = DEFAULT_ENRICHMENT_CONCURRENCY,
+        budget: int = DEFAULT_ENRICHMENT_BUDGET,
+        host_delay: float = 0.0,
+    ):
+        self.database_manager = database_manager
+        self.concurrency = max(concurrency, 1)
+        self.budget = budget
+        self.throttle = HostThrottle(delay=host_delay)
+        # Queued listings as (url, content hash) by nepremicnine id, in order.
+        self.pending: dict[str, tuple[str, str]] = {}
+        # Listings of the current run that failed since the last loaded page.
+        self.failed: list[tuple[str, tuple[str, str]]] = []
+
+    def submit(self, listings: dict[str, ListingRecord]):
+        """
+        Queues new or changed listings.
+        A queued listing is replaced by its latest content.
+        :param listings: listings by nepremicnine id
+        :return:
+        """
+        for nepremicnine_id, listing in listings.items():
+            self.pending.pop(nepremicnine_id, None)
+            self.pending[nepremicnine_id] = (listing.url, listing.content_hash())
+        ENRICHMENT_PENDING.set(len(self.pending))
+
+    async def run(self) -> int:
+        """
+        Loads the details of the queued listings within the budget.
+        :return: number of loaded listing pages
+        """
+        if not self.pending:
+            return 0
+
+        # Listings with cached details of the same content are not loaded.
+        cached = await self.database_manager.get_cached_details(
+            (nepremicnine_id, content_hash)
+            for nepremicnine_id, (_, content_hash) in self.pending.items()
+        )
+        for nepremicnine_id, _ in cached:
+            del self.pending[nepremicnine_id]
+
+        batch = list(self.pending.items())[: self.budget]
+        for nepremicnine_id, _ in batch:
+            del self.pending[nepremicnine_id]
+
+        loaded = 0
+
+        if batch:
+            logger.info(
+                "Loading details of %d listings, %d stay queued.",
+                len(batch),
+                len(self.pending),
+            )
+
+            queue = asyncio.Queue()
+            for item in batch:
+                queue.put_nowait(item)
+            self.failed = []
+
+            async with HttpFetcher(concurrency=self.concurrency) as fetcher:
+                results = await asyncio.gather(
+                    *(self.work(fetcher, queue) for _ in range(self.concurrency))
+                )
+            loaded = sum(results)
+
+            if len(self.failed) >= HTTP_MAX_FAILURES:
+                # Listings queued meanwhile keep their newer content.
+                leftover = self.failed + [
+                    queue.get_nowait() for _ in range(queue.qsize())
+                ]
+                self.pending = dict(leftover) | self.pending
+                logger.warning(
+                    "Stopped loading details after %d failed pages, %d listings stay queued.",
+                    len(self.failed),
+                    len(leftover),
+                )
+
+        ENRICHMENT_PENDING.set(len(self.pending))
+
+        return loaded
+
+    async def work(self, fetcher: HttpFetcher, queue: asyncio.Queue) -> int:
+        """
+        Worker that loads queued listing pages until the queue is empty or
+        too many pages failed in a row.
+        A listing that fails before a page is loaded again is dropped, it is
+        queued again when it changes.
+        :param fetcher: HttpFetcher
+        :param queue: asyncio.Queue of (nepremicnine id, (url, content hash))
+        :return: number of loaded listing pages
+        """
+        loaded = 0
+
+        while not queue.empty() and len(self.failed) < HTTP_MAX_FAILURES:
+            nepremicnine_id, (url, content_hash) = queue.get_nowait()
+            try:
+                await self.throttle.wait(url)
+                html = await fetcher.fetch_html(url)
+                details = await asyncio.to_thread(parse_detail_html, html)
+                await self.database_manager.save_details(
+                    nepremicnine_id=nepremicnine_id,
+                    content_hash=content_hash,
+                    details=details,
+                )
+                ENRICHMENT_PAGES_TOTAL.inc()
+                loaded += 1
+                self.failed = []
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning("Error loading details of %s: %s", nepremicnine_id, e)
+                self.failed.append((nepremicnine_id, (url, content_hash)))
+
+        return loaded
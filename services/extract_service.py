@@ -1,77 +1,277 @@
 # pylint: disable=too-many-locals
 """Module that contains data extraction logic."""
 
-from playwright.async_api import Page, Locator
+import logging
+import re
 
+from bs4 import BeautifulSoup, Tag
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
+
+from common.constants import COOKIE_DIALOG_TIMEOUT
+from common.listing import ListingRecord
 from logger.logger import logger
+from services.metrics_service import LISTING_PARSE_SECONDS, LISTINGS_TOTAL
+
+# XPath of the listing cards on a result page.
+RESULTS_XPATH = """//*[@id="vsebina760"]/div[contains(@class, "seznam")]
+/div/div/div/div[contains(@class, "col-md-6 col-md-12 position-relative")]"""
+
+# XPath of the next page button.
+NEXT_PAGE_XPATH = "//*[@id='pagination']/ul/li[contains(@class, 'paging_next')]"
+
+# Script that extracts all listing cards and the pagination state in a single
+# round-trip to the browser. XPaths are relative to the listing card.
+EXTRACT_PAGE_SCRIPT = """
+([resultsXpath, nextPageXpath]) => {
+    const all = (xpath, node) => {
+        if (!node) {
+            return [];
+        }
+        const snapshot = document.evaluate(
+            xpath, node, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null
+        );
+        return Array.from(
+            {length: snapshot.snapshotLength}, (_, i) => snapshot.snapshotItem(i)
+        );
+    };
+    const first = (xpath, node) => all(xpath, node)[0] || null;
+    const text = (node) => (node ? node.innerText : null);
+    const attribute = (node, name) => (node ? node.getAttribute(name) : null);
+
+    const results = all(resultsXpath, document).map((item) => {
+        const details = first('div/div[contains(@class, "property-details")]', item);
+        return {
+            image_url: attribute(
+                first('div/div[contains(@class, "property-image")]/a[2]/img', item),
+                "data-src"
+            ),
+            details: text(first("span", details)),
+            rooms_count: text(first('span/span[@class="tipi"]', details)),
+            url: attribute(first("a", details), "href"),
+            title: text(first("a/h2", details)),
+            description: text(first('p[@itemprop="description"]', details)),
+            props: all('ul[@itemprop="disambiguatingDescription"]/li', details).map(text),
+            price: attribute(first('meta[@itemprop="price"]', details), "content"),
+        };
+    });
+
+    return {results: results, more_pages: all(nextPageXpath, document).length > 0};
+}
+"""
+
+# CSS selectors equivalent to the XPaths above, used by the HTML parser.
+RESULTS_SELECTOR = (
+    '#vsebina760 > div[class*="seznam"] > div > div > div'
+    ' > div[class*="col-md-6 col-md-12 position-relative"]'
+)
+NEXT_PAGE_SELECTOR = '#pagination > ul > li[class*="paging_next"]'
+
+# CSS selectors of the details on a listing page.
+DETAIL_ADDRESS_SELECTOR = '[itemprop="streetAddress"], [itemprop="address"]'
+DETAIL_AGENCY_SELECTOR = (
+    '[itemprop="seller"] [itemprop="name"], [itemprop="provider"] [itemprop="name"]'
+)
+DETAIL_PHOTO_SELECTOR = (
+    'meta[property="og:image"], a[href*="img.nepremicnine.net"],'
+    ' img[data-src*="img.nepremicnine.net"]'
+)
+
+# Energy class in the listing page text, e.g. "Energetski razred: B2".
+ENERGY_CLASS_PATTERN = re.compile(
+    r"energetsk\w* razred\w*\W*([A-G][12]?)\b", re.IGNORECASE
+)
 
 
 async def parse_page(
     browser_page: Page,
+    reject_cookies: bool = True,
 ) -> tuple[
-    dict[str, tuple[str, str | None, str, float, float, int, str | None, str | None]],
+    dict[str, ListingRecord],
     bool,
 ]:
     """Parses the page and extracts data.
     Returns a dictionary of listings and a boolean if there are more pages.
     :param browser_page: Page
-    :return: dict[str, tuple[str, str | None, str, float, float, int, str | None, str | None]], bool
+    :param reject_cookies: bool, False if the cookies were already rejected in the context
+    :return: dict[str, ListingRecord], bool
     """
 
     logger.debug("Parsing page %s.", browser_page.url)
 
     # Reject cookies.
-    await browser_page.get_by_role("button", name="Zavrni").click()
+    if reject_cookies:
+        try:
+            await browser_page.get_by_role("button", name="Zavrni").click(
+                timeout=COOKIE_DIALOG_TIMEOUT
+            )
+        except PlaywrightTimeoutError:
+            logger.debug("Cookie dialog was not shown.")
 
     # Wait for the page to load.
     await browser_page.wait_for_load_state("domcontentloaded")
 
     extracted_data = {}
 
-    results = await browser_page.locator(
-        """//*[@id="vsebina760"]/div[contains(@class, "seznam")]
-        /div/div/div/div[contains(@class, "col-md-6 col-md-12 position-relative")]"""
-    ).all()
+    # Extract all the listings in a single call.
+    page_data = await browser_page.evaluate(
+        EXTRACT_PAGE_SCRIPT, [RESULTS_XPATH, NEXT_PAGE_XPATH]
+    )
 
     # Loop through all the listings.
-    for result in results:
+    for record in page_data["results"]:
         try:
-            item_id, data = await parse_result(result)
+            with LISTING_PARSE_SECONDS.time():
+                item_id, data = parse_result(record)
+            LISTINGS_TOTAL.inc()
             extracted_data[item_id] = data
         except Exception as e:  # pylint: disable=broad-except
             logger.warning("Error parsing result: %s", e)
 
     # Check if there is a next page button.
-    more_pages = (
-        await browser_page.locator(
-            """xpath=//*[@id='pagination']
-            /ul/li[contains(@class, 'paging_next')]"""
-        ).count()
-        > 0
-    )
+    more_pages = page_data["more_pages"]
 
     logger.info("Parsing page %s finished.", browser_page.url)
 
     return extracted_data, more_pages
 
 
-async def parse_result(
-    item: Locator,
-) -> tuple[str, tuple[str, str | None, str, float, float, int, str | None, str | None]]:
-    """Extracts data from the result."""
+def parse_html(
+    html: str,
+) -> tuple[
+    dict[str, ListingRecord],
+    bool,
+]:
+    """Parses the downloaded page html and extracts data.
+    Returns a dictionary of listings and a boolean if there are more pages.
+    Raises ValueError if the page does not contain the search results.
+    :param html: str
+    :return: dict[str, ListingRecord], bool
+    """
 
-    logger.debug("Extracting result data...")
+    logger.debug("Parsing html page.")
 
-    image_locator = item.locator(
-        'xpath=div/div[contains(@class, "property-image")]/a[2]/img'
-    )
+    soup = BeautifulSoup(html, "html.parser")
+
+    if soup.select_one("#vsebina760") is None:
+        raise ValueError("Page does not contain search results.")
+
+    extracted_data = {}
+
+    # Loop through all the listings.
+    for item in soup.select(RESULTS_SELECTOR):
+        try:
+            with LISTING_PARSE_SECONDS.time():
+                item_id, data = parse_result(extract_html_record(item))
+            LISTINGS_TOTAL.inc()
+            extracted_data[item_id] = data
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Error parsing result: %s", e)
 
-    image_url = None
+    # Check if there is a next page button.
+    more_pages = soup.select_one(NEXT_PAGE_SELECTOR) is not None
+
+    logger.debug("Parsing html page finished.")
+
+    return extracted_data, more_pages
+
+
+def parse_detail_html(html: str) -> dict:
+    """Parses the downloaded listing page html and extracts the details
+    that are not shown on the result page.
+    Missing details are None.
+    :param html: str
+    :return: dict with address, agency, energy_class and photos
+    """
+    soup = BeautifulSoup(html, "html.parser")
+
+    def text(selector: str) -> str | None:
+        node = soup.select_one(selector)
+        return (" ".join(node.get_text(" ").split()) or None) if node else None
+
+    photos = []
+    for node in soup.select(DETAIL_PHOTO_SELECTOR):
+        photo_url = node.get("content") or node.get("href") or node.get("data-src")
+        if photo_url and photo_url.startswith("http"):
+            # Replace the url domain, so it will work on Discord.
+            photo_url = photo_url.replace(
+                "img.nepremicnine.net", "img.onnepremicnine.net"
+            )
+            if photo_url not in photos:
+                photos.append(photo_url)
+
+    energy_class = ENERGY_CLASS_PATTERN.search(soup.get_text(" "))
+
+    return {
+        "address": text(DETAIL_ADDRESS_SELECTOR),
+        "agency": text(DETAIL_AGENCY_SELECTOR),
+        "energy_class": energy_class.group(1).upper() if energy_class else None,
+        "photos": photos,
+    }
+
+
+def extract_html_record(item: Tag) -> dict:
+    """Extracts the raw texts and attributes of a listing card.
+    Returns the same record as the EXTRACT_PAGE_SCRIPT.
+    """
+
+    def first(selector: str, node: Tag | None) -> Tag | None:
+        return node.select_one(selector) if node else None
+
+    def text(node: Tag | None) -> str | None:
+        # Collapse whitespace like the rendered inner text.
+        return " ".join(node.get_text(" ").split()) if node else None
+
+    def attribute(node: Tag | None, name: str) -> str | None:
+        return node.get(name) if node else None
+
+    details = first(':scope > div > div[class*="property-details"]', item)
+
+    return {
+        "image_url": attribute(
+            first(
+                ':scope > div > div[class*="property-image"] > a:nth-of-type(2) > img',
+                item,
+            ),
+            "data-src",
+        ),
+        "details": text(first(":scope > span", details)),
+        "rooms_count": text(first(':scope > span > span[class="tipi"]', details)),
+        "url": attribute(first(":scope > a", details), "href"),
+        "title": text(first(":scope > a > h2", details)),
+        "description": text(first(':scope > p[itemprop="description"]', details)),
+        "props": [
+            text(prop)
+            for prop in (
+                details.select(':scope > ul[itemprop="disambiguatingDescription"] > li')
+                if details
+                else []
+            )
+        ],
+        "price": attribute(
+            first(':scope > meta[itemprop="price"]', details), "content"
+        ),
+    }
+
+
+def normalize_whitespace(value: str | None) -> str | None:
+    """
+    Collapses all whitespace of the text into single spaces.
+    :param value: str | None
+    :return: str | None
+    """
+    return " ".join(value.split()) if value is not None else None
+
+
+def parse_result(
+    record: dict,
+) -> tuple[str, ListingRecord]:
+    """Extracts data from the result record.
+    The record contains raw texts and attributes of a single listing card.
+    """
+
+    logger.debug("Extracting result data...")
 
-    if (await image_locator.count()) > 0:
-        image_url = await item.locator(
-            'xpath=div/div[contains(@class, "property-image")]/a[2]/img'
-        ).first.get_attribute("data-src")
+    image_url = record["image_url"]
 
     # Replace the url domain, so it will work on Discord.
     if image_url and image_url.startswith("http"):
@@ -80,46 +280,40 @@ async def parse_result(
         image_url = None
         logger.debug("No image found for the listing.")
 
-    details = item.locator('xpath=div/div[contains(@class, "property-details")]')
-
-    listing_type, property_type = (
-        await details.locator("xpath=span").inner_text()
-    ).split(":")
+    listing_type, property_type = record["details"].split(":")
 
     property_type = property_type[1].strip().replace(",", "")
 
-    rooms_count = await details.locator('xpath=span/span[@class="tipi"]').inner_text()
+    rooms_count = record["rooms_count"]
 
-    url = await details.locator("xpath=a").get_attribute("href")
+    url = record["url"]
 
-    title = await details.locator("xpath=a/h2").inner_text()
+    # Browser inner text keeps line breaks, html text does not. Both are
+    # collapsed, so the content hash does not depend on the fetch mode.
+    title = normalize_whitespace(record["title"])
 
-    description = await details.locator('xpath=p[@itemprop="description"]').inner_text()
+    description = normalize_whitespace(record["description"])
 
-    props = await details.locator(
-        'xpath=ul[@itemprop="disambiguatingDescription"]/li'
-    ).all()
+    props = [normalize_whitespace(prop) for prop in record["props"]]
 
-    size = float(
-        (await props[0].inner_text()).split(" ")[0].replace(".", "").replace(",", ".")
-    )
+    size = float(props[0].split(" ")[0].replace(".", "").replace(",", "."))
 
     if len(props) > 1:
-        year = int(await props[1].inner_text())
-        floor = await props[2].inner_text() if len(props) > 2 else None
+        year = int(props[1])
+        floor = props[2] if len(props) > 2 else None
 
     else:
         year = None
         floor = None
 
-    price = float(
-        await details.locator('xpath=meta[@itemprop="price"]').get_attribute("content")
-    )
+    price = float(record["price"])
 
     item_id = url.split("/")[-2]
 
-    logger.debug(
-        """
+    # Skip building the arguments of the per listing log unless it is written.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            """
     Title: %s,
     Listing Type: %s,
     Property Type: %s,
@@ -133,29 +327,29 @@ async def parse_result(
     ID: %s,
     Url: %s.
     """,
-        title,
-        listing_type,
-        property_type,
-        rooms_count,
-        image_url,
-        description,
-        price,
-        size,
-        year,
-        floor,
-        item_id,
-        url,
-    )
+            title,
+            listing_type,
+            property_type,
+            rooms_count,
+            image_url,
+            description,
+            price,
+            size,
+            year,
+            floor,
+            item_id,
+            url,
+        )
 
     logger.debug("Parsing result finished.")
 
-    return item_id, (
-        title,
-        image_url,
-        description,
-        price,
-        size,
-        year,
-        floor,
-        url,
+    return item_id, ListingRecord(
+        title=title,
+        image_url=image_url,
+        description=description,
+        price=price,
+        size=size,
+        year=year,
+        floor=floor,
+        url=url,
     )
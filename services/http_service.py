@@ -0,0 +1,81 @@
+"""Module that contains browserless page fetching logic."""
+
+import asyncio
+
+import aiohttp
+
+from common.constants import HTTP_MAX_FAILURES, HTTP_TIMEOUT, USER_AGENT
+from common.listing import ListingRecord
+from logger.logger import logger
+from services.extract_service import parse_html
+from services.metrics_service import PAGE_LOAD_SECONDS, PAGE_PARSE_SECONDS, PAGES_TOTAL
+
+
+class HttpFetcher:
+    """
+    Downloads and parses result pages over a pooled HTTP session.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.session: aiohttp.ClientSession | None = None
+        self.failures = 0
+
+    async def __aenter__(self):
+        logger.debug("Opening HTTP session.")
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max(self.concurrency, 1)),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "text/html,application/xhtml+xml",
+                "Accept-Language": "sl,en;q=0.8",
+            },
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        logger.debug("Closing HTTP session.")
+        await self.session.close()
+
+    @property
+    def available(self) -> bool:
+        """
+        Returns False after too many failed fetches, so the browser is used instead.
+        """
+        return self.failures < HTTP_MAX_FAILURES
+
+    async def fetch_page(self, page_url: str) -> tuple[dict[str, ListingRecord], bool]:
+        """
+        Downloads and parses the result page.
+        Returns a dictionary of listings and a boolean if there are more pages.
+        :param page_url: str
+        :return:
+        """
+        logger.debug("Fetching page %s over HTTP.", page_url)
+
+        try:
+            with PAGE_LOAD_SECONDS.time():
+                html = await self.fetch_html(page_url)
+
+            # Parse in a thread, so the event loop is not blocked.
+            with PAGE_PARSE_SECONDS.time():
+                results = await asyncio.to_thread(parse_html, html)
+            PAGES_TOTAL.inc()
+        except Exception:
+            self.failures += 1
+            raise
+
+        logger.info("Parsing page %s finished.", page_url)
+
+        return results
+
+    async def fetch_html(self, page_url: str) -> str:
+        """
+        Downloads the page html.
+        :param page_url: str
+        :return: str
+        """
+        async with self.session.get(page_url) as response:
+            response.raise_for_status()
+            return await response.text()
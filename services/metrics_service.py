@@ -0,0 +1,302 @@
+"""
+Module that contains performance metrics logic.
+"""
+
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from aiohttp import web
+
+from common.constants import METRICS_LATENCY_BUCKETS
+from logger.logger import logger
+
+
+class Metric(ABC):
+    """
+    Base class of the metrics. Metrics can be updated from any thread.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> list[tuple[str, float]]:
+        """
+        Returns the samples of the metric as (name with labels, value).
+        :return: list[tuple[str, float]]
+        """
+
+    def render(self) -> str:
+        """
+        Returns the metric in the Prometheus text format.
+        :return: str
+        """
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(f"{name} {value:g}" for name, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Value that only increases.
+    """
+
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        """
+        Increases the counter.
+        :param amount: float
+        :return:
+        """
+        with self.lock:
+            self.value += amount
+
+    def samples(self) -> list[tuple[str, float]]:
+        with self.lock:
+            return [(self.name, self.value)]
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down.
+    """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.value = 0.0
+
+    def set(self, value: float):
+        """
+        Sets the gauge.
+        :param value: float
+        :return:
+        """
+        with self.lock:
+            self.value = value
+
+    def samples(self) -> list[tuple[str, float]]:
+        with self.lock:
+            return [(self.name, self.value)]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...] = METRICS_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """
+        Records an observed value.
+        :param value: float
+        :return:
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "Timer":
+        """
+        Returns a context manager that observes the duration of its block in seconds.
+        :return: Timer
+        """
+        return Timer(self)
+
+    def samples(self) -> list[tuple[str, float]]:
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            label = "+Inf" if bound == float("inf") else f"{bound:g}"
+            samples.append((f'{self.name}_bucket{{le="{label}"}}', cumulative))
+        samples.append((f"{self.name}_sum", total))
+        samples.append((f"{self.name}_count", cumulative))
+        return samples
+
+
+class Timer:
+    """
+    Context manager that observes the duration of its block in a histogram.
+    """
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start_time = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.perf_counter() - self.start_time
+        self.histogram.observe(self.elapsed)
+
+
+class MetricsRegistry:
+    """
+    Registry of all metrics of the application.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Adds the metric to the registry.
+        :param metric: Metric
+        :return: the metric
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text format.
+        :return: str
+        """
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+class MetricsServer:
+    """
+    Local HTTP server exposing the metrics on /metrics.
+    """
+
+    def __init__(self, metrics_registry: MetricsRegistry, host: str, port: int):
+        self.registry = metrics_registry
+        self.host = host
+        self.port = port
+        self.runner: web.AppRunner | None = None
+
+    async def start(self):
+        """
+        Starts the server.
+        :return:
+        """
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info("Serving metrics on http://%s:%d/metrics.", self.host, self.port)
+
+    async def close(self):
+        """
+        Stops the server.
+        :return:
+        """
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, _request: web.Request) -> web.Response:
+        """
+        Returns the metrics.
+        """
+        return web.Response(
+            text=self.registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+
+registry = MetricsRegistry()
+
+SCAN_DURATION_SECONDS = registry.register(
+    Histogram(
+        "nepremicnine_scan_duration_seconds",
+        "Duration of a scan.",
+        buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200),
+    )
+)
+SCAN_LISTINGS_PER_SECOND = registry.register(
+    Histogram(
+        "nepremicnine_scan_listings_per_second",
+        "Crawled listings per second of a scan.",
+        buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 50, 100),
+    )
+)
+SCAN_ERRORS_TOTAL = registry.register(
+    Counter("nepremicnine_scan_errors_total", "Scans in which a search failed.")
+)
+PAGE_LOAD_SECONDS = registry.register(
+    Histogram("nepremicnine_page_load_seconds", "Time to load a result page.")
+)
+PAGE_PARSE_SECONDS = registry.register(
+    Histogram("nepremicnine_page_parse_seconds", "Time to parse a result page.")
+)
+PAGES_TOTAL = registry.register(
+    Counter("nepremicnine_pages_total", "Loaded result pages.")
+)
+LISTING_PARSE_SECONDS = registry.register(
+    Histogram(
+        "nepremicnine_listing_parse_seconds",
+        "Time to extract the data of a single listing.",
+        buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+    )
+)
+LISTINGS_TOTAL = registry.register(
+    Counter("nepremicnine_listings_total", "Parsed listings.")
+)
+DB_QUERY_SECONDS = registry.register(
+    Histogram("nepremicnine_db_query_seconds", "Duration of a database query.")
+)
+DB_COMMIT_SECONDS = registry.register(
+    Histogram(
+        "nepremicnine_db_commit_seconds", "Duration of the transaction saving a scan."
+    )
+)
+DELIVERY_SEND_SECONDS = registry.register(
+    Histogram("nepremicnine_delivery_send_seconds", "Time to send a discord message.")
+)
+DELIVERY_MESSAGES_TOTAL = registry.register(
+    Counter("nepremicnine_delivery_messages_total", "Sent discord messages.")
+)
+DELIVERY_FAILURES_TOTAL = registry.register(
+    Counter(
+        "nepremicnine_delivery_failures_total", "Discord messages that were not sent."
+    )
+)
+ENRICHMENT_PAGES_TOTAL = registry.register(
+    Counter("nepremicnine_enrichment_pages_total", "Loaded listing detail pages.")
+)
+ENRICHMENT_PENDING = registry.register(
+    Gauge("nepremicnine_enrichment_pending", "Listings waiting for their details.")
+)
+BROWSER_RSS_BYTES = registry.register(
+    Gauge("nepremicnine_browser_rss_bytes", "Memory used by the browser processes.")
+)
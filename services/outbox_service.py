@@ -0,0 +1,144 @@
+"""
+Module that contains notification outbox logic.
+"""
+
+import asyncio
+from datetime import timedelta
+
+import discord
+
+from common.constants import (
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_RETENTION_DAYS,
+)
+from common.listing import ListingRecord
+from database.database_manager import DatabaseManager
+from logger.logger import logger
+from services.delivery_service import build_embed, DeliveryQueue
+
+
+class OutboxConsumer:
+    """
+    Delivers the notifications saved in the outbox table.
+    The spider saves notifications together with the scanned listings and the
+    consumer drains them in the background. A notification is only marked as
+    delivered after discord accepted it, so every notification is delivered
+    at least once, also after a restart.
+    """
+
+    def __init__(self, database_manager: DatabaseManager, client: discord.Client):
+        self.database_manager = database_manager
+        self.client = client
+        self.delivery_queue = DeliveryQueue(client=client, on_sent=self.on_sent)
+        # Ids of notifications in the delivery queue.
+        self.in_flight: set[int] = set()
+        self.wake_event = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        """
+        Starts draining the outbox in the background.
+        :return:
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run(), name="outbox-consumer")
+
+    def wake(self):
+        """
+        Drains the outbox now, instead of waiting for the next poll.
+        :return:
+        """
+        self.wake_event.set()
+
+    async def close(self):
+        """
+        Stops the consumer and the delivery queue.
+        :return:
+        """
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.delivery_queue.close()
+
+    async def run(self):
+        """
+        Drains the outbox when woken up or every poll interval.
+        :return:
+        """
+        await self.client.wait_until_ready()
+
+        while True:
+            try:
+                await self.drain()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Error draining the outbox: %s", e)
+
+            try:
+                await asyncio.wait_for(
+                    self.wake_event.wait(), timeout=OUTBOX_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+            self.wake_event.clear()
+
+    async def drain(self):
+        """
+        Queues all pending notifications for delivery.
+        :return:
+        """
+        while True:
+            notifications = await self.database_manager.get_pending_notifications(
+                exclude_ids=self.in_flight,
+                max_attempts=OUTBOX_MAX_ATTEMPTS,
+                limit=OUTBOX_BATCH_SIZE,
+            )
+            if not notifications:
+                break
+
+            logger.debug("Queueing %d notifications.", len(notifications))
+
+            for notification_id, channel_id, payload in notifications:
+                self.in_flight.add(notification_id)
+                if "listing" in payload:
+                    self.delivery_queue.submit(
+                        int(channel_id),
+                        embed=build_embed(
+                            ListingRecord.from_payload(payload["listing"])
+                        ),
+                        token=notification_id,
+                    )
+                else:
+                    self.delivery_queue.submit(
+                        int(channel_id),
+                        content=payload["content"],
+                        token=notification_id,
+                    )
+
+        deleted = await self.database_manager.delete_delivered_notifications(
+            older_than=timedelta(days=OUTBOX_RETENTION_DAYS)
+        )
+        if deleted:
+            logger.debug("Deleted %d delivered notifications.", deleted)
+
+    async def on_sent(self, notification_ids: list[int], delivered: bool):
+        """
+        Marks sent notifications as delivered or records the failed attempt.
+        Failed notifications are retried by the next drain.
+        :param notification_ids: list[int]
+        :param delivered: bool
+        :return:
+        """
+        try:
+            if delivered:
+                await self.database_manager.mark_notifications_delivered(
+                    notification_ids
+                )
+            else:
+                await self.database_manager.record_notification_failure(
+                    notification_ids
+                )
+        finally:
+            self.in_flight.difference_update(notification_ids)
@@ -0,0 +1,148 @@
+"""
+Module that contains the read path of the slash commands.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from common.constants import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL, QUERY_PAGE_SIZE
+from database.database_manager import DatabaseManager
+from logger.logger import logger
+
+
+class QueryCache:
+    """
+    Answers of recent queries with a time to live.
+    The oldest answer is dropped when the cache is full.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Answers as (expiry time, value) by query key.
+        self.entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+
+    async def get_or_load(self, key: tuple, load: Callable[[], Awaitable]):
+        """
+        Returns the cached answer of the query or loads and caches it.
+        :param key: query name and arguments
+        :param load: coroutine function loading the answer
+        :return: the answer
+        """
+        now = time.monotonic()
+
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            logger.debug("Query %s answered from the cache.", key)
+            return entry[1]
+
+        value = await load()
+
+        self.entries[key] = (now + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        return value
+
+    def invalidate(self):
+        """
+        Drops all cached answers.
+        :return:
+        """
+        self.entries.clear()
+
+
+class ListingQueries:
+    """
+    Cached queries over the saved listings and prices.
+    The cache is invalidated after every scan, so answers are never older
+    than the last scan.
+    """
+
+    def __init__(
+        self,
+        database_manager: DatabaseManager,
+        ttl: float = QUERY_CACHE_TTL,
+        page_size: int = QUERY_PAGE_SIZE,
+    ):
+        self.database_manager = database_manager
+        self.page_size = page_size
+        self.cache = QueryCache(ttl=ttl, max_entries=QUERY_CACHE_MAX_ENTRIES)
+
+    def invalidate(self):
+        """
+        Drops the cached answers after the saved data changed.
+        :return:
+        """
+        self.cache.invalidate()
+
+    async def search(
+        self,
+        region: str | None,
+        min_price: float | None,
+        max_price: float | None,
+        page: int,
+    ) -> tuple[list[tuple[str, str, float, str | None]], bool]:
+        """
+        Returns a page of saved listings and a boolean if there are more pages.
+        :param region: str | None
+        :param min_price: float | None
+        :param max_price: float | None
+        :param page: page number starting with 1
+        :return: list of (nepremicnine id, url, last price, region), bool
+        """
+
+        async def load():
+            # One extra listing tells if there is a next page.
+            listings = await self.database_manager.search_listings(
+                region=region,
+                min_price=min_price,
+                max_price=max_price,
+                limit=self.page_size + 1,
+                offset=(page - 1) * self.page_size,
+            )
+            return listings[: self.page_size], len(listings) > self.page_size
+
+        return await self.cache.get_or_load(
+            ("search", region, min_price, max_price, page), load
+        )
+
+    async def price_history(
+        self, nepremicnine_id: str
+    ) -> tuple[str, list[tuple[datetime, float]]] | None:
+        """
+        Returns the url and the price history of a saved listing.
+        :param nepremicnine_id: str
+        :return: (url, list of (accessed time, price)), None if the listing is not saved
+        """
+        return await self.cache.get_or_load(
+            ("price_history", nepremicnine_id),
+            lambda: self.database_manager.get_listing_history(nepremicnine_id),
+        )
+
+    async def details(self, nepremicnine_id: str) -> dict | None:
+        """
+        Returns the details loaded from the listing page.
+        :param nepremicnine_id: str
+        :return: dict, None if the details were not loaded
+        """
+        return await self.cache.get_or_load(
+            ("details", nepremicnine_id),
+            lambda: self.database_manager.get_details(nepremicnine_id),
+        )
+
+    async def stats(
+        self, region: str | None
+    ) -> list[tuple[str | None, int, float, float, float]]:
+        """
+        Returns the listing count and price statistics by region.
+        :param region: str | None
+        :return: list of (region, count, min price, average price, max price)
+        """
+        return await self.cache.get_or_load(
+            ("stats", region),
+            lambda: self.database_manager.get_region_stats(region),
+        )
@@ -0,0 +1,169 @@
+"""
+Module that contains search scheduling logic.
+"""
+
+import random
+import time
+
+from common.constants import (
+    DEFAULT_SCHEDULER_JITTER,
+    DEFAULT_SCHEDULER_MAX_INTERVAL,
+    DEFAULT_SCHEDULER_MIN_INTERVAL,
+    DEFAULT_SPIDER_FULL_SWEEP_EVERY,
+    SCHEDULER_INITIAL_INTERVAL,
+    SCHEDULER_RATE_SMOOTHING,
+    SCHEDULER_TARGET_LISTINGS,
+)
+from logger.logger import logger
+
+
+class SearchSchedule:  # pylint: disable=too-few-public-methods
+    """
+    Scheduling state of a single search url. Times are in seconds.
+    """
+
+    def __init__(self, interval: float, next_run: float):
+        self.interval = interval
+        self.next_run = next_run
+        self.last_run: float | None = None
+        # Moving average of new listings per second, None before the first scan.
+        self.rate: float | None = None
+        self.scans = 0
+        # Interval set in the config, disables adapting the interval.
+        self.fixed_interval: float | None = None
+
+
+class SearchScheduler:
+    """
+    Decides when each search url is scanned.
+    Every search has its own interval, adapted to the rate of new listings
+    observed in its scans, so a scan finds about SCHEDULER_TARGET_LISTINGS
+    new listings. Busy searches are scanned up to every `min_interval`
+    minutes and quiet ones down to every `max_interval` minutes. The
+    interval at most doubles after a scan, so a quiet search slows down
+    gradually. Searches with an interval set in the config keep it.
+    Intervals are randomly shortened or extended by `jitter`, so searches
+    do not stay aligned.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = DEFAULT_SCHEDULER_MIN_INTERVAL,
+        max_interval: float = DEFAULT_SCHEDULER_MAX_INTERVAL,
+        jitter: float = DEFAULT_SCHEDULER_JITTER,
+        full_sweep_every: int = DEFAULT_SPIDER_FULL_SWEEP_EVERY,
+    ):
+        self.min_interval = max(min_interval, 1) * 60
+        self.max_interval = max(max_interval * 60, self.min_interval)
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.full_sweep_every = max(full_sweep_every, 1)
+        self.schedules: dict[str, SearchSchedule] = {}
+
+    def due(
+        self,
+        page_urls: list[str],
+        now: float | None = None,
+        fixed_intervals: dict[str, float | None] | None = None,
+    ) -> list[str]:
+        """
+        Returns the search urls that should be scanned now.
+        New searches are due immediately, searches that are not configured
+        anymore are forgotten.
+        :param page_urls: all configured search urls
+        :param now: monotonic time in seconds
+        :param fixed_intervals: minutes between scans by url, None to adapt
+        :return: list[str]
+        """
+        now = time.monotonic() if now is None else now
+
+        for page_url in set(self.schedules) - set(page_urls):
+            logger.debug("Removing schedule of %s.", page_url)
+            del self.schedules[page_url]
+
+        for page_url in page_urls:
+            if page_url not in self.schedules:
+                self.schedules[page_url] = SearchSchedule(
+                    interval=self.clamp(SCHEDULER_INITIAL_INTERVAL * 60), next_run=now
+                )
+
+            schedule = self.schedules[page_url]
+            fixed_interval = (fixed_intervals or {}).get(page_url)
+            schedule.fixed_interval = (
+                fixed_interval * 60 if fixed_interval is not None else None
+            )
+            if schedule.fixed_interval is not None:
+                schedule.interval = schedule.fixed_interval
+
+        return [
+            page_url
+            for page_url in dict.fromkeys(page_urls)
+            if self.schedules[page_url].next_run <= now
+        ]
+
+    def full_sweep(self, page_url: str) -> bool:
+        """
+        Returns True if all pages of the search should be crawled in its next scan.
+        :param page_url: str
+        :return: bool
+        """
+        schedule = self.schedules.get(page_url)
+        return schedule is None or schedule.scans % self.full_sweep_every == 0
+
+    def record(self, page_url: str, new_listings: int | None, now: float | None = None):
+        """
+        Records a finished scan of the search and schedules the next one.
+        :param page_url: str
+        :param new_listings: number of new listings found, None if the scan failed
+        :param now: monotonic time in seconds
+        :return:
+        """
+        now = time.monotonic() if now is None else now
+
+        schedule = self.schedules.get(page_url)
+        if schedule is None:
+            return
+
+        # Failed scans are retried after the same interval. The first scan
+        # finds all listings of the search, so the rate is measured only
+        # between two scans.
+        if (
+            new_listings is not None
+            and schedule.last_run is not None
+            and schedule.fixed_interval is None
+        ):
+            rate = new_listings / max(now - schedule.last_run, 1.0)
+            schedule.rate = (
+                rate
+                if schedule.rate is None
+                else SCHEDULER_RATE_SMOOTHING * rate
+                + (1 - SCHEDULER_RATE_SMOOTHING) * schedule.rate
+            )
+
+            target_interval = (
+                SCHEDULER_TARGET_LISTINGS / schedule.rate
+                if schedule.rate > 0
+                else self.max_interval
+            )
+            schedule.interval = self.clamp(min(target_interval, schedule.interval * 2))
+
+        if new_listings is not None:
+            schedule.last_run = now
+            schedule.scans += 1
+
+        delay = schedule.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        schedule.next_run = now + delay
+
+        logger.debug(
+            "Next scan of %s in %.0f min (interval %.0f min).",
+            page_url,
+            delay / 60,
+            schedule.interval / 60,
+        )
+
+    def clamp(self, interval: float) -> float:
+        """
+        Limits the interval to the configured bounds.
+        :param interval: seconds
+        :return: seconds
+        """
+        return min(max(interval, self.min_interval), self.max_interval)
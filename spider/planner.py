@@ -0,0 +1,179 @@
+"""Module that contains search planning logic."""
+
+import re
+from urllib.parse import urlsplit
+
+from logger.logger import logger
+
+# Price and size filters of the last path segment of a search url,
+# e.g. "cena-od-400-do-900-eur-na-mesec" or "velikost-od-40-m2".
+RANGE_FILTER_PATTERN = re.compile(
+    r"^(?P<name>cena|velikost)(?:-od-(?P<low>\d+))?(?:-do-(?P<high>\d+))?-(?P<unit>.+)$"
+)
+
+# Units of the range filters that can be checked on a parsed listing.
+RANGE_FILTER_UNITS = {"cena": ("eur", "eur-na-mesec"), "velikost": ("m2",)}
+
+# Property type segments of a search url.
+PROPERTY_TYPES = (
+    "stanovanje",
+    "hisa",
+    "vikend",
+    "posest",
+    "poslovni-prostor",
+    "garaza",
+    "pocitniski-objekt",
+)
+
+
+class Search:
+    """
+    Normalized nepremicnine.net search url.
+    The url is split into a key of the path segments (listing type, region,
+    property type, ...) and unknown filters, and into the price and size
+    ranges, which can be checked locally on a parsed listing.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+
+        parts = urlsplit(url)
+        segments = [segment for segment in parts.path.lower().split("/") if segment]
+
+        # Ranges as (low, high), None is unbounded.
+        self.ranges = {"cena": (None, None), "velikost": (None, None)}
+        self.units = {}
+        other_filters = []
+
+        if segments:
+            for value in segments[-1].split(","):
+                match = RANGE_FILTER_PATTERN.match(value)
+                if match and match["unit"] in RANGE_FILTER_UNITS[match["name"]]:
+                    self.ranges[match["name"]] = (
+                        float(match["low"]) if match["low"] else None,
+                        float(match["high"]) if match["high"] else None,
+                    )
+                    self.units[match["name"]] = match["unit"]
+                else:
+                    other_filters.append(value)
+            if len(other_filters) < len(segments[-1].split(",")):
+                segments = segments[:-1] + (
+                    [",".join(sorted(other_filters))] if other_filters else []
+                )
+
+        # Market of the listings found by the search: the listing type, the
+        # region and the property type, e.g. "oglasi-oddaja/ljubljana-mesto/stanovanje".
+        # Sales and rentals or different property types are never mixed,
+        # a search without a known property type is its own market.
+        self.region = market_key(
+            [",".join(sorted(segment.split(","))) for segment in segments]
+        )
+
+        # Order of comma separated values does not change the search.
+        self.key = (
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            tuple(",".join(sorted(segment.split(","))) for segment in segments),
+            parts.query,
+        )
+
+    def covers(self, other: "Search") -> bool:
+        """
+        Returns True if all listings of the other search are found by this search.
+        :param other: Search
+        :return: bool
+        """
+        return self.key == other.key and all(
+            contains(bounds, other.ranges[name])
+            and self.units.get(name, other.units.get(name)) == other.units.get(name)
+            for name, bounds in self.ranges.items()
+        )
+
+    def matches(self, price: float, size: float) -> bool:
+        """
+        Returns True if a listing with the price and size is found by this search.
+        :param price: float
+        :param size: float
+        :return: bool
+        """
+        return in_range(price, self.ranges["cena"]) and in_range(
+            size, self.ranges["velikost"]
+        )
+
+
+def market_key(segments: list[str]) -> str | None:
+    """
+    Returns the market of the search path segments without the ranges.
+    :param segments: normalized path segments
+    :return: str, None for a search without a path
+    """
+    if not segments:
+        return None
+
+    property_type = next(
+        (segment for segment in segments[1:] if segment in PROPERTY_TYPES), None
+    )
+    if property_type is None:
+        return "/".join(segments)
+
+    return "/".join(
+        segments[:1]
+        + ([segments[1]] if segments[1] != property_type else [])
+        + [property_type]
+    )
+
+
+def plan_searches(page_urls: list[str]) -> dict[str, str]:
+    """
+    Plans the smallest set of searches that covers all configured searches.
+    A search is crawled through the first configured search that covers it
+    and is not covered by any other search, its results are then filtered
+    locally. Searches that only partially overlap are crawled separately.
+    Returns the url to crawl for every configured url.
+    """
+    searches = [Search(page_url) for page_url in dict.fromkeys(page_urls)]
+
+    # Searches that are not covered by a wider search are always crawled.
+    widest = [
+        search
+        for search in searches
+        if not any(
+            other.covers(search) and not search.covers(other) for other in searches
+        )
+    ]
+
+    plan = {}
+
+    for search in searches:
+        crawled = next(other for other in widest if other.covers(search))
+        plan[search.url] = crawled.url
+
+        if crawled is not search:
+            logger.debug("Search %s is crawled through %s.", search.url, crawled.url)
+
+    logger.info(
+        "Planned %d searches for %d configured searches.",
+        len(set(plan.values())),
+        len(plan),
+    )
+
+    return plan
+
+
+def contains(outer: tuple, inner: tuple) -> bool:
+    """
+    Returns True if the inner range is inside the outer range.
+    """
+    outer_low, outer_high = outer
+    inner_low, inner_high = inner
+    return (
+        outer_low is None or (inner_low is not None and inner_low >= outer_low)
+    ) and (outer_high is None or (inner_high is not None and inner_high <= outer_high))
+
+
+def in_range(value: float, bounds: tuple) -> bool:
+    """
+    Returns True if the value is inside the inclusive range.
+    """
+    low, high = bounds
+    return (low is None or value >= low) and (high is None or value <= high)
@@ -1,133 +1,671 @@
 # pylint: disable=too-many-locals
 """Module that contains main spider logic."""
 
+import asyncio
+import time
 from collections import defaultdict
-
-from playwright.async_api import async_playwright
-
+from contextlib import AsyncExitStack
+from datetime import datetime
+from typing import Collection
+
+from common.constants import (
+    DEFAULT_SPIDER_CONCURRENCY,
+    DEFAULT_SPIDER_FETCH_MODE,
+    DEFAULT_SPIDER_HOST_DELAY,
+    DEFAULT_SPIDER_INCREMENTAL,
+    DEFAULT_SPIDER_PAGE_WINDOW,
+)
+from common.listing import ListingRecord
 from database.database_manager import DatabaseManager
 from logger.logger import logger
+from services.analytics_service import analyze_listings, PriceColumns
+from services.browser_service import BrowserManager
+from services.config_service import load_config, RoutingTable
+from services.dedup_service import find_reposts
+from services.enrichment_service import EnrichmentWorker
 from services.extract_service import parse_page
-
-
-async def run_spider(database_manager: DatabaseManager) -> tuple[dict, bool]:
+from services.http_service import HttpFetcher
+from services.metrics_service import (
+    PAGE_LOAD_SECONDS,
+    PAGE_PARSE_SECONDS,
+    PAGES_TOTAL,
+    SCAN_DURATION_SECONDS,
+    SCAN_ERRORS_TOTAL,
+    SCAN_LISTINGS_PER_SECOND,
+)
+from util.util import HostThrottle
+
+
+async def run_spider(  # pylint: disable=too-many-arguments
+    database_manager: DatabaseManager,
+    browser_manager: BrowserManager,
+    *,
+    concurrency: int = DEFAULT_SPIDER_CONCURRENCY,
+    host_delay: float = DEFAULT_SPIDER_HOST_DELAY,
+    page_window: int = DEFAULT_SPIDER_PAGE_WINDOW,
+    fetch_mode: str = DEFAULT_SPIDER_FETCH_MODE,
+    incremental: bool = DEFAULT_SPIDER_INCREMENTAL,
+    routing_table: RoutingTable | None = None,
+    crawl_urls: Collection[str] | None = None,
+    full_sweep_urls: Collection[str] = (),
+    enrichment: EnrichmentWorker | None = None,
+) -> tuple[dict, bool, dict[str, int | None]]:
     """
-    Setups the playwright library and runs the crawler.
-    Returns a dictionary with listings and a boolean indicating if an error occurred.
+    Setups the page fetchers and runs the crawler.
+    Only the planned searches of the routing table are crawled, so searches
+    that are covered by a wider configured search are filtered from the
+    results of the wider search.
+    Searches are crawled in parallel, but at most `concurrency` result pages
+    are loaded at the same time. With `concurrency` and `page_window` set to 1
+    the crawl is sequential.
+    With the "http" fetch mode pages are downloaded without a browser and
+    the browser of the browser manager is only used if that fails.
+    Only the searches in `crawl_urls` are crawled, all planned searches if
+    it is None. The config file is loaded if no routing table is given.
+    In incremental mode pagination of a search stops at the first page that
+    contains only known listings with unchanged prices, unless the search is
+    in `full_sweep_urls`. The `incremental` config option of a search
+    overrides `incremental`.
+    Notifications for the found listings are saved to the outbox together
+    with the listings, so they are delivered even if the bot stops.
+    New listings that are reposts of saved listings are linked to the original
+    listing and only sent if their price differs from the saved price.
+    New and changed listings are queued in the `enrichment` worker, if given.
+    Returns a dictionary with listings, a boolean indicating if an error occurred
+    and the number of new listings by crawled url (None if the search failed).
     """
     logger.info("Spider started.")
 
+    # Config errors are raised before anything is crawled.
+    if routing_table is None:
+        routing_table = await asyncio.to_thread(load_config)
+
+    scan_time = datetime.now()
+    start_time = time.perf_counter()
+
     # Dictionary to store the listings. Key is the channel name.
     discord_listings = defaultdict(list)
 
-    async with async_playwright() as playwright:
-        # Connect to the browser.
-        browser = await playwright.chromium.launch(headless=False)
+    async with AsyncExitStack() as stack:
+        # Let the browser manager recycle the browser after the scan.
+        stack.push_async_callback(browser_manager.scan_finished)
 
-        # Read page urls from a config file.
-        config = await read_config()
+        fetcher = None
+        if fetch_mode == "http":
+            fetcher = await stack.enter_async_context(
+                HttpFetcher(concurrency=concurrency)
+            )
 
-        saved_results = await database_manager.get_listings()
+        crawler = Crawler(
+            browser_manager=browser_manager,
+            fetcher=fetcher,
+            concurrency=concurrency,
+            host_delay=host_delay,
+            page_window=page_window,
+            database_manager=database_manager,
+        )
+
+        crawled_searches = await crawl_searches(
+            crawler=crawler,
+            routing_table=routing_table,
+            crawl_urls=crawl_urls,
+            full_sweep_urls=full_sweep_urls,
+            incremental=incremental,
+        )
+
+        error = any(search_error for _, search_error in crawled_searches.values())
+
+        # Look up only the listings found in this scan.
+        saved_results = await database_manager.get_last_prices(
+            nepremicnine_id
+            for results, _ in crawled_searches.values()
+            for nepremicnine_id in results
+        )
+
+        # New listings and prices are saved at the end in a single transaction.
+        new_listings, new_prices, changed_listings, found_listings, new_counts = (
+            find_changes(
+                crawled_searches=crawled_searches,
+                routing_table=routing_table,
+                saved_results=saved_results,
+            )
+        )
+
+        # Saved fields are only loaded for the listings with a changed hash.
+        listing_changes = diff_listings(
+            saved_contents=await database_manager.get_listing_contents(
+                changed_listings.keys()
+            ),
+            changed_listings=changed_listings,
+        )
+
+        # New listings are compared with the saved listings in their LSH buckets.
+        signatures, reposts = await find_reposts(
+            database_manager=database_manager, listings=new_listings
+        )
+
+        # Previous prices are only needed for the listings with a new price
+        # and the originals of the reposts.
+        price_columns = PriceColumns(
+            *await database_manager.get_price_columns(
+                new_prices.keys() | set(reposts.values())
+            )
+        )
+
+        found_listings = link_reposts(
+            found_listings=found_listings,
+            new_listings=new_listings,
+            reposts=reposts,
+            price_columns=price_columns,
+        )
+
+        # Listings sent to several channels share the record, the history
+        # is attached and the listing analyzed once.
+        found_ids = {}
+        for _, listing, listing_id in found_listings:
+            listing.attach_prices(
+                price_columns.history(listing_id) if listing_id is not None else None
+            )
+            found_ids[listing] = listing_id
+
+        await analyze_listings(
+            database_manager=database_manager,
+            listings=list(found_ids),
+            listing_ids=list(found_ids.values()),
+            price_columns=price_columns,
+            crawled_listings={
+                nepremicnine_id: listing
+                for results, _ in crawled_searches.values()
+                for nepremicnine_id, listing in results.items()
+            },
+        )
+
+        for entry, listing, _ in found_listings:
+            if entry.alerts_match(listing):
+                discord_listings[entry.channel_id].append(listing)
+
+        await database_manager.save_scan(
+            new_listings=new_listings,
+            new_prices=new_prices,
+            notifications=build_notifications(
+                discord_listings=discord_listings, error=error, scan_time=scan_time
+            ),
+            changed_listings=changed_listings,
+            listing_changes=listing_changes,
+            signatures=signatures,
+            reposts=reposts,
+            regions=saved_regions(crawled_searches, saved_results),
+        )
+
+        # Details are only loaded for new and changed listings.
+        if enrichment is not None:
+            changed = set(changed_listings.values())
+            enrichment.submit(
+                {
+                    nepremicnine_id: listing
+                    for results, _ in crawled_searches.values()
+                    for nepremicnine_id, listing in results.items()
+                    if nepremicnine_id in new_listings or listing in changed
+                }
+            )
 
-        error = False
+    # Count all listings in discord_listings.
+    total_listings = sum(len(listings) for listings in discord_listings.values())
 
-        # For each url, send the results to a different channel.
-        for channel, page_url in config:
-            logger.debug("Processing channel %s with URL %s", channel, page_url)
+    # Record the scan metrics.
+    duration = time.perf_counter() - start_time
+    crawled_listings = sum(len(results) for results, _ in crawled_searches.values())
+    SCAN_DURATION_SECONDS.observe(duration)
+    SCAN_LISTINGS_PER_SECOND.observe(crawled_listings / max(duration, 0.001))
+    if error:
+        SCAN_ERRORS_TOTAL.inc()
+
+    logger.info(
+        "Spider finished in %.1f s. Crawled %d listings and found %d new listings.",
+        duration,
+        crawled_listings,
+        total_listings,
+    )
+
+    return discord_listings, error, new_counts
+
+
+def find_changes(
+    crawled_searches: dict[str, tuple[dict, bool]],
+    routing_table: RoutingTable,
+    saved_results: dict[str, tuple[int, float, str | None]],
+) -> tuple[dict, dict, dict, list, dict]:
+    """
+    Compares the crawled listings with the saved listings.
+    Content changes are found by comparing the content hashes.
+    A new listing found by several searches has the record and the region
+    of the first search.
+    Returns the new listings by nepremicnine id, the new prices by listing id,
+    the listings with changed content by listing id, the listings to send as
+    (entry, data, listing id of a saved listing) and the number of new
+    listings by crawled url (None if the search failed).
+    """
+    new_listings = {}
+    new_prices = {}
+    changed_listings = {}
 
-            # create a new page inside context.
-            browser_page = await browser.new_page(
-                # pylint: disable=line-too-long
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
-            )
+    # Listings to send, as (entry, data, listing id of a saved listing).
+    found_listings = []
 
-            # Prevent loading some resources for better performance.
-            # await browser_page.route("**/*", block_aggressively)
+    # Number of new listings by crawled url, None if the search failed.
+    new_counts = {}
 
-            await browser_page.goto(page_url)
+    # Results are processed in config order, so the output is the same
+    # as with the sequential crawl. All listings are saved, but only
+    # the matching ones are sent to a channel.
+    for crawl_url, (results, search_error) in crawled_searches.items():
+        routes = routing_table.routes([crawl_url])
+        new_count = 0
 
-            # await browser_page.pause()
+        for nepremicnine_id, new_data in results.items():
+            logger.debug("Listing ID: %s", nepremicnine_id)
 
-            more_pages = True
+            new_data.region = routing_table.regions.get(crawl_url)
 
-            index = 1
+            if nepremicnine_id in saved_results:
+                logger.debug("Listing already saved.")
 
-            results = {}
+                new_price = new_data.price
 
-            while more_pages:
-                if index > 1:
-                    # Close the previous page.
-                    await browser_page.close()
+                listing_id, last_price, content_hash = saved_results[nepremicnine_id]
 
-                    # create a new page.
-                    browser_page = await browser.new_page()
+                if content_hash != new_data.content_hash():
+                    logger.debug("Content of %s changed.", nepremicnine_id)
+                    changed_listings[listing_id] = new_data
 
-                    await browser_page.goto(f"{page_url}{index}/")
+                if listing_id not in new_prices and last_price == new_price:
+                    logger.debug("No new saved_price detected.")
+                    continue
 
-                try:
-                    results_tmp, more_pages = await parse_page(
-                        browser_page=browser_page
-                    )
-                    results.update(results_tmp)
-                except Exception as e:  # pylint: disable=broad-except
-                    logger.error("Error parsing page: %s", e)
-                    error = True
-                index += 1
+                logger.debug("New saved_price detected for %s.", nepremicnine_id)
+                new_prices[listing_id] = new_price
 
-            for nepremicnine_id, new_data in results.items():
-                logger.debug("Listing ID: %s", nepremicnine_id)
+            else:
+                # We found a new listing.
+                logger.debug("New listing found %s.", nepremicnine_id)
 
-                if nepremicnine_id in saved_results:
-                    logger.debug("Listing already saved.")
+                listing_id = None
+                # A new listing found by several searches is sent with the
+                # record of the first search, so it is linked only once.
+                new_data = new_listings.setdefault(nepremicnine_id, new_data)
 
-                    _, _, _, new_price, _, _, _, _ = new_data
+            new_count += 1
 
-                    listing_id, old_prices = saved_results[nepremicnine_id]
+            for entry in routes:
+                if routing_table.matches(
+                    entry, price=new_data.price, size=new_data.size
+                ):
+                    found_listings.append((entry, new_data, listing_id))
+
+        new_counts[crawl_url] = None if search_error else new_count
+
+    return new_listings, new_prices, changed_listings, found_listings, new_counts
 
-                    if old_prices[-1] != new_price:
-                        logger.debug(
-                            "New saved_price detected for %s.", nepremicnine_id
-                        )
-                        await database_manager.add_new_price(
-                            listing_id=listing_id,
-                            current_price=new_price,
-                        )
 
-                        # Merge old and new prices.
-                        old_prices.append(new_price)
-                        new_data = new_data[:3] + (old_prices,) + new_data[4:]
+def saved_regions(
+    crawled_searches: dict[str, tuple[dict, bool]],
+    saved_results: dict[str, tuple[int, float, str | None]],
+) -> dict[str, list[str]]:
+    """
+    Groups the crawled saved listings by the region of their first search.
+    Returns the nepremicnine ids by region.
+    """
+    listing_regions = {}
+    for results, _ in crawled_searches.values():
+        for nepremicnine_id, listing in results.items():
+            if nepremicnine_id in saved_results and listing.region is not None:
+                listing_regions.setdefault(nepremicnine_id, listing.region)
 
-                        discord_listings[channel].append(new_data)
+    regions = defaultdict(list)
+    for nepremicnine_id, region in listing_regions.items():
+        regions[region].append(nepremicnine_id)
 
-                    else:
-                        logger.debug("No new saved_price detected.")
+    return regions
 
-                    continue
 
-                # We found a new listing.
-                logger.debug("New listing found %s.", nepremicnine_id)
+def link_reposts(
+    found_listings: list,
+    new_listings: dict[str, ListingRecord],
+    reposts: dict[str, int],
+    price_columns: PriceColumns,
+) -> list:
+    """
+    Links the found reposts to their original listing, so they are sent
+    as a price change of the original with the price history of the
+    original and all its reposts.
+    Reposts with the latest saved price of that history are not sent.
+    Returns the listings to send as (entry, data, listing id of a saved listing).
+    """
+    originals = {
+        new_listings[nepremicnine_id]: original_id
+        for nepremicnine_id, original_id in reposts.items()
+    }
 
-                await database_manager.save_listing(nepremicnine_id, new_data)
+    linked_listings = []
 
-                # Convert price to a list of prices
-                new_data = new_data[:3] + ([new_data[3]],) + new_data[4:]
-                discord_listings[channel].append(new_data)
-            await browser_page.close()
+    for entry, listing, listing_id in found_listings:
+        if listing in originals:
+            listing_id = originals[listing]
+            history = price_columns.history(listing_id)
+            if history is not None and listing.price == history[-1]:
+                logger.debug("Repost %s has an unchanged price.", listing.url)
+                continue
 
-    await browser.close()
+        linked_listings.append((entry, listing, listing_id))
 
-    # Count all listings in discord_listings.
-    total_listings = sum(len(listings) for listings in discord_listings.values())
+    return linked_listings
 
-    logger.info("Spider finished. Found %d new listings.", total_listings)
 
-    return discord_listings, error
+def diff_listings(
+    saved_contents: dict[int, dict], changed_listings: dict[int, ListingRecord]
+) -> list[tuple[int, str, str | None, str | None]]:
+    """
+    Compares the saved and the crawled content fields of the changed listings.
+    Listings saved before their fields were stored have no saved fields,
+    they are only updated.
+    Returns a list of (listing id, field, old value, new value).
+    """
+    listing_changes = []
+
+    for listing_id, listing in changed_listings.items():
+        saved_content = saved_contents.get(listing_id)
+        if not saved_content or all(value is None for value in saved_content.values()):
+            continue
+
+        for field, old_value in saved_content.items():
+            new_value = getattr(listing, field)
+            if old_value != new_value:
+                listing_changes.append(
+                    (
+                        listing_id,
+                        field,
+                        None if old_value is None else str(old_value),
+                        None if new_value is None else str(new_value),
+                    )
+                )
+
+    if listing_changes:
+        logger.info(
+            "Found %d changed fields of %d listings.",
+            len(listing_changes),
+            len(changed_listings),
+        )
+
+    return listing_changes
 
 
-async def read_config():
+async def crawl_searches(
+    crawler: "Crawler",
+    routing_table: RoutingTable,
+    crawl_urls: Collection[str] | None,
+    full_sweep_urls: Collection[str],
+    incremental: bool,
+) -> dict[str, tuple[dict, bool]]:
     """
-    Read the config file.
-    Each line in the file contains a channel name and a URL.
+    Crawls the planned searches of the routing table once.
+    `incremental` is the early stop of the searches without the config option.
+    Returns the listings and a boolean if an error occurred by crawled url,
+    in config order.
+    """
+    crawl_urls = [
+        crawl_url
+        for crawl_url in routing_table.crawl_urls
+        if crawl_urls is None or crawl_url in crawl_urls
+    ]
+
+    crawled_searches = await asyncio.gather(
+        *(
+            crawler.crawl_channel(
+                page_url=crawl_url,
+                full_sweep=crawl_url in full_sweep_urls,
+                page_window=routing_table.concurrency(crawl_url),
+                incremental=routing_table.incremental(crawl_url, default=incremental),
+            )
+            for crawl_url in crawl_urls
+        )
+    )
+
+    return dict(zip(crawl_urls, crawled_searches))
+
+
+def build_notifications(
+    discord_listings: dict, error: bool, scan_time: datetime
+) -> list[tuple[str, str, dict]]:
+    """
+    Builds the outbox notifications of the found listings.
+    The dedup key of a listing contains its price history, so a listing is
+    announced again only when its price changes.
+    Returns a list of (channel id, dedup key, payload).
+    """
+    notifications = []
+
+    for channel, listings in discord_listings.items():
+        notifications.append(
+            (
+                channel,
+                f"{channel}:{scan_time.isoformat()}:summary",
+                {"content": f"Found {len(listings)} new listings."},
+            )
+        )
+
+        for listing in listings:
+            notifications.append(
+                (
+                    channel,
+                    f"{channel}:{listing.url}:{len(listing.prices)}:{listing.price}",
+                    {"listing": listing.to_payload()},
+                )
+            )
+
+        if error:
+            notifications.append(
+                (
+                    channel,
+                    f"{channel}:{scan_time.isoformat()}:error",
+                    {"content": "An error occurred while scanning the website."},
+                )
+            )
+
+    return notifications
+
+
+class Crawler:
     """
-    with open("config.txt", encoding="utf-8") as file:
-        return [line.strip().split() for line in file.readlines()]
+    Crawls result pages over a bounded pool of pages.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        browser_manager: BrowserManager,
+        fetcher: HttpFetcher | None,
+        concurrency: int,
+        host_delay: float,
+        page_window: int,
+        database_manager: DatabaseManager | None = None,
+    ):
+        self.browser_manager = browser_manager
+        self.fetcher = fetcher
+        # Bounded pool of result pages and per-host politeness delay.
+        self.page_pool = asyncio.Semaphore(max(concurrency, 1))
+        self.throttle = HostThrottle(delay=host_delay)
+        self.page_window = max(page_window, 1)
+        # Database used to stop pagination early, None crawls all pages.
+        self.database_manager = database_manager
+
+    async def crawl_channel(
+        self,
+        page_url: str,
+        full_sweep: bool = False,
+        page_window: int | None = None,
+        incremental: bool = False,
+    ) -> tuple[dict, bool]:
+        """
+        Crawls all result pages of a single search url.
+        `page_window` overrides the page window of the crawler.
+        With `incremental` set and unless `full_sweep` is set, pagination
+        stops early at a page with only known listings.
+        `page_window` consecutive pages are loaded in parallel. Pages after the
+        last page or a failed page are discarded.
+        Browser pages of the search are reused for all result pages.
+        Returns a dictionary with listings and a boolean indicating if an error occurred.
+        """
+        logger.debug("Processing URL %s", page_url)
+
+        page_window = max(page_window, 1) if page_window else self.page_window
+
+        results = {}
+
+        error = False
+
+        more_pages = True
+
+        index = 1
+
+        # Browser pages of the search, one for each page window slot.
+        browser_pages = {}
+
+        try:
+            while more_pages:
+                crawled_pages = await asyncio.gather(
+                    *(
+                        self.crawl_page(
+                            page_url=(
+                                page_url
+                                if page_index == 1
+                                else f"{page_url}{page_index}/"
+                            ),
+                            search_url=page_url,
+                            browser_pages=browser_pages,
+                            slot=slot,
+                        )
+                        for slot, page_index in enumerate(
+                            range(index, index + page_window)
+                        )
+                    )
+                )
+
+                for page_results, page_more in crawled_pages:
+                    # A failed page stops the search, the next scan retries it.
+                    if page_results is None:
+                        logger.warning("Stopping %s at a failed page.", page_url)
+                        error = True
+                        more_pages = False
+                        break
+
+                    results.update(page_results)
+                    more_pages = page_more
+
+                    if (
+                        more_pages
+                        and incremental
+                        and not full_sweep
+                        and await self.only_known_listings(page_results)
+                    ):
+                        logger.info(
+                            "Page of %s contains only known listings. Stopping.",
+                            page_url,
+                        )
+                        more_pages = False
+
+                    if not more_pages:
+                        break
+
+                index += page_window
+        finally:
+            for browser_page in browser_pages.values():
+                await browser_page.close()
+
+        return results, error
+
+    async def only_known_listings(self, page_results: dict) -> bool:
+        """
+        Returns True if all listings of the page are saved and their prices
+        and content did not change.
+        """
+        if self.database_manager is None or not page_results:
+            return False
+
+        known_listings = await self.database_manager.get_last_prices(
+            page_results.keys()
+        )
+
+        return all(
+            nepremicnine_id in known_listings
+            and known_listings[nepremicnine_id][1:] == (data.price, data.content_hash())
+            for nepremicnine_id, data in page_results.items()
+        )
+
+    async def crawl_page(
+        self, page_url: str, search_url: str, browser_pages: dict, slot: int
+    ) -> tuple[dict | None, bool]:
+        """
+        Loads and parses a single result page.
+        The page is downloaded over HTTP if possible and with the browser otherwise.
+        The browser page of the slot is created in the search context once and
+        then reused, so cookie consent is only given once per search.
+        Returns a dictionary of listings (None if an error occurred) and a boolean
+        if there are more pages.
+        """
+        async with self.page_pool:
+            if self.fetcher is not None and self.fetcher.available:
+                await self.throttle.wait(page_url)
+                start_time = time.perf_counter()
+                try:
+                    page_data = await self.fetcher.fetch_page(page_url=page_url)
+                    logger.info(
+                        "Fetched page %s over HTTP in %.2f s.",
+                        page_url,
+                        time.perf_counter() - start_time,
+                    )
+                    return page_data
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.warning(
+                        "HTTP fetch of %s failed, using the browser: %s", page_url, e
+                    )
+
+            await self.throttle.wait(page_url)
+
+            try:
+                start_time = time.perf_counter()
+
+                browser_page = browser_pages.get(slot)
+                if browser_page is None or browser_page.is_closed():
+                    # create a new page inside the search context.
+                    context = await self.browser_manager.get_context(name=search_url)
+                    browser_page = await context.new_page()
+                    browser_pages[slot] = browser_page
+
+                await browser_page.goto(page_url)
+
+                load_time = time.perf_counter() - start_time
+                PAGE_LOAD_SECONDS.observe(load_time)
+
+                page_data = await parse_page(
+                    browser_page=browser_page,
+                    reject_cookies=not self.browser_manager.cookies_rejected(
+                        name=search_url
+                    ),
+                )
+                self.browser_manager.mark_cookies_rejected(name=search_url)
+
+                parse_time = time.perf_counter() - start_time - load_time
+                PAGE_PARSE_SECONDS.observe(parse_time)
+                PAGES_TOTAL.inc()
+
+                logger.info(
+                    "Loaded page %s in %.2f s and parsed it in %.2f s.",
+                    page_url,
+                    load_time,
+                    parse_time,
+                )
+
+                return page_data
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Error parsing page: %s", e)
+                return None, True
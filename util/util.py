@@ -1,15 +1,234 @@
 """Module that contains util functions."""
 
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from playwright.async_api import Route
+
 from common.constants import (
+    blocked_domains,
+    cached_resource_types,
     excluded_resource_types,
 )
+from logger.logger import logger
 
 
-async def block_aggressively(route):
+class RequestInterceptor:
     """
-    Prevent loading some resources for better performance.
+    Blocks unneeded requests and serves repeated static assets from a disk cache.
+    Requests are blocked by resource type and by a third-party domain denylist.
+    Cached assets are revalidated with their ETag, so only changed assets
+    are downloaded again.
     """
-    if route.request.resource_type in excluded_resource_types:
-        await route.abort()
-    else:
+
+    def __init__(self, cache_dir: str | None):
+        self.cache_dir = cache_dir
+        self.blocked_requests = 0
+        self.cached_requests = 0
+        self.cached_bytes = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    async def handle(self, route: Route):
+        """
+        Route handler that blocks, serves from cache or continues the request.
+        :param route: Route
+        :return:
+        """
+        request = route.request
+
+        if request.resource_type in excluded_resource_types or is_blocked_domain(
+            request.url
+        ):
+            self.blocked_requests += 1
+            await route.abort()
+            return
+
+        if (
+            self.cache_dir
+            and request.method == "GET"
+            and request.resource_type in cached_resource_types
+        ):
+            await self.handle_cached(route)
+            return
+
         await route.continue_()
+
+    async def handle_cached(self, route: Route):
+        """
+        Serves the asset from the cache if its ETag did not change,
+        otherwise downloads and caches it.
+        :param route: Route
+        :return:
+        """
+        url = route.request.url
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        meta_path = os.path.join(self.cache_dir, f"{key}.json")
+        body_path = os.path.join(self.cache_dir, f"{key}.body")
+
+        try:
+            meta = await asyncio.to_thread(read_json, meta_path)
+
+            headers = dict(route.request.headers)
+            if meta:
+                headers["if-none-match"] = meta["etag"]
+
+            response = await route.fetch(headers=headers)
+
+            if meta and response.status == 304:
+                body = await asyncio.to_thread(read_bytes, body_path)
+                self.cached_requests += 1
+                self.cached_bytes += len(body)
+                await route.fulfill(status=200, headers=meta["headers"], body=body)
+                return
+
+            body = await response.body()
+            etag = response.headers.get("etag")
+            if response.status == 200 and etag:
+                await asyncio.to_thread(
+                    write_cache,
+                    meta_path,
+                    body_path,
+                    {"url": url, "etag": etag, "headers": response.headers},
+                    body,
+                )
+            await route.fulfill(response=response, body=body)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.debug("Error serving %s from the cache: %s", url, e)
+            await route.continue_()
+
+    def log_stats(self):
+        """
+        Logs and resets the blocked and cached request counters.
+        :return:
+        """
+        logger.info(
+            "Blocked %d requests and served %d requests (%d bytes) from the cache.",
+            self.blocked_requests,
+            self.cached_requests,
+            self.cached_bytes,
+        )
+        self.blocked_requests = 0
+        self.cached_requests = 0
+        self.cached_bytes = 0
+
+
+def is_blocked_domain(url: str) -> bool:
+    """
+    Returns True if the url host is on the domain denylist.
+    :param url: str
+    :return: bool
+    """
+    host = urlparse(url).hostname or ""
+    return any(
+        host == domain or host.endswith(f".{domain}") for domain in blocked_domains
+    )
+
+
+def read_json(path: str) -> dict | None:
+    """
+    Reads a json file, returns None if it does not exist.
+    :param path: str
+    :return:
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def read_bytes(path: str) -> bytes:
+    """
+    Reads a binary file.
+    :param path: str
+    :return:
+    """
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def write_cache(meta_path: str, body_path: str, meta: dict, body: bytes):
+    """
+    Writes a cached asset. The body is written first, so the metadata
+    never points to a missing body.
+    :return:
+    """
+    with open(body_path, "wb") as file:
+        file.write(body)
+    with open(meta_path, "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+
+class HostThrottle:  # pylint: disable=too-few-public-methods
+    """
+    Enforces a minimum delay between two requests to the same host.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.locks = defaultdict(asyncio.Lock)
+        self.last_request = {}
+
+    async def wait(self, url: str):
+        """
+        Waits until a request to the url host is allowed.
+        :param url: str
+        :return:
+        """
+        if self.delay <= 0:
+            return
+
+        host = urlparse(url).netloc
+
+        async with self.locks[host]:
+            if host in self.last_request:
+                elapsed = time.monotonic() - self.last_request[host]
+                if elapsed < self.delay:
+                    await asyncio.sleep(self.delay - elapsed)
+            self.last_request[host] = time.monotonic()
+
+
+def descendant_rss(pid: int | None = None) -> int | None:
+    """
+    Returns the resident memory in bytes of all descendant processes.
+    Returns None if the /proc file system is not available.
+    :param pid: parent process id, defaults to the current process
+    :return:
+    """
+    pid = pid or os.getpid()
+
+    if not os.path.isdir("/proc"):
+        return None
+
+    processes = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # The process name can contain spaces, so split after it.
+        fields = stat[stat.rindex(")") + 2 :].split()
+        processes[int(entry)] = (int(fields[1]), int(fields[21]))
+
+    children = {}
+    for child, (parent, _) in processes.items():
+        children.setdefault(parent, []).append(child)
+
+    rss_pages = 0
+    pending = list(children.get(pid, []))
+    while pending:
+        child = pending.pop()
+        rss_pages += processes[child][1]
+        pending.extend(children.get(child, []))
+
+    return rss_pages * os.sysconf("SC_PAGE_SIZE")